@@ -0,0 +1,118 @@
+import import_string
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from reversion.conf import get_config
+
+
+BACKENDS = [
+    app_name.split('.')[-1] for app_name in settings.INSTALLED_APPS
+    if isinstance(app_name, str) and app_name.startswith('reversion.backends.')
+]
+
+
+class Backend:
+
+    """
+    Storage backend of revisions and versions.
+
+    A backend is implemented by a ``reversion.backends.<name>.models`` module, see ``ModuleBackend``.
+    """
+
+    name = None
+
+    def prepare_version_object(self, obj, content_type, object_id, model_db, version_options, explicit, using,
+                               is_delete):
+        raise NotImplementedError
+
+    def get_latest_versions(self, versions, using):
+        raise NotImplementedError
+
+    def iter_versions_at(self, model, date, model_db=None, using=None):
+        raise NotImplementedError
+
+    def iter_unversioned_object_ids(self, model, model_db=None, using=None, batch_size=500):
+        raise NotImplementedError
+
+    def save_revision(self, date_created, user, comment, versions, using):
+        raise NotImplementedError
+
+    def save_revisions(self, date_created, user, comment, revision_versions, using):
+        raise NotImplementedError
+
+    def get_db_name(self):
+        raise NotImplementedError
+
+    def get_revision_or_none(self, id):
+        raise NotImplementedError
+
+    def get_version_queryset(self, using=None):
+        raise NotImplementedError
+
+    def get_for_model(self, model, model_db=None, using=None):
+        return self.get_version_queryset(using).get_for_model(model, model_db=model_db)
+
+    def get_for_object_reference(self, model, object_id, model_db=None, using=None):
+        return self.get_version_queryset(using).get_for_object_reference(model, object_id, model_db=model_db)
+
+    def get_for_object(self, obj, model_db=None, using=None):
+        return self.get_version_queryset(using).get_for_object(obj, model_db=model_db)
+
+    def get_deleted(self, model, model_db=None, using=None):
+        return self.get_version_queryset(using).get_deleted(model, model_db=model_db)
+
+
+class ModuleBackend(Backend):
+
+    """Backend bound to the functions and models of a backend models module."""
+
+    def __init__(self, name, module):
+        self.name = name
+        self.module = module
+        self.Revision = module.Revision
+        self.Version = module.Version
+        # Bind the module functions once, they are called for every versioned object.
+        self.prepare_version_object = module.prepare_version_object
+        self.get_latest_versions = module.get_latest_versions
+        self.iter_versions_at = module.iter_versions_at
+        self.iter_unversioned_object_ids = module.iter_unversioned_object_ids
+        self.save_revision = module.save_revision
+        self.save_revisions = module.save_revisions
+        self.get_db_name = module.get_db_name
+        self.get_revision_or_none = module.get_revision_or_none
+        self.get_version_queryset = module.get_version_queryset
+
+
+_backends = {}
+_backend = None
+_backend_config = None
+_backend_override = None
+
+
+def get_installed_backend(name):
+    if name not in BACKENDS:
+        raise ImproperlyConfigured('Reversion backend "{}" is not installed'.format(name))
+    if name not in _backends:
+        _backends[name] = ModuleBackend(name, import_string('reversion.backends.{}.models'.format(name)))
+    return _backends[name]
+
+
+def get_backend():
+    """Returns the active backend, resolved once per configuration."""
+    global _backend, _backend_config
+    if _backend_override is not None:
+        return _backend_override
+    config = get_config()
+    if _backend_config is not config:
+        if not BACKENDS:
+            raise ImproperlyConfigured('No reversion backend is installed')
+        _backend = get_installed_backend(config.backend or BACKENDS[0])
+        _backend_config = config
+    return _backend
+
+
+def set_backend(backend):
+    """Replaces the active backend, e.g. in tests. Pass ``None`` to restore the configured backend."""
+    global _backend_override
+    _backend_override = backend
@@ -0,0 +1,207 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.utils import timezone
+
+from reversion.backends.dynamodb.models import (
+    Version, VersionPayload, get_object_content_type_key, get_payload_revision_id
+)
+from reversion.backends.dynamodb.queryset import PAYLOAD_OBJ_KEY, iter_pages
+from reversion.backends.utils import get_delta_keyframe_key
+from reversion.management.commands import BaseRevisionCommand
+from reversion.revisions import _get_content_type
+
+
+# Number of items deleted by one batch write task.
+DELETE_CHUNK_SIZE = 25
+
+
+class WriteBudget:
+
+    """Limits the number of written items per second of all workers, ``None`` means no limit."""
+
+    def __init__(self, units_per_second=None):
+        self.units_per_second = units_per_second
+        self._lock = threading.Lock()
+        self._next_time = time.monotonic()
+
+    def consume(self, units):
+        if not self.units_per_second:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start_time = max(now, self._next_time)
+            self._next_time = start_time + units / self.units_per_second
+        if start_time > now:
+            time.sleep(start_time - now)
+
+
+def _get_revision_items(revision_id):
+    return list(Version.objects_all.set_hash_key(revision_id))
+
+
+def _get_object_versions(object_key):
+    return list(
+        Version.objects_all.set_index(Version.object_date_created_index).set_hash_key(
+            object_key
+        ).set_scan_index_forward(False)
+    )
+
+
+class Command(BaseRevisionCommand):
+
+    help = 'Deletes DynamoDB revisions for a given app [and model].'
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--days',
+            default=0,
+            type=int,
+            help='Delete only revisions older than the specified number of days.',
+        )
+        parser.add_argument(
+            '--keep',
+            default=0,
+            type=int,
+            help='Keep the specified number of revisions (most recent) for each object.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            action='store',
+            type=int,
+            default=100,
+            help='Versions are loaded from the model index in pages. Defaults to 100.',
+        )
+        parser.add_argument(
+            '--workers',
+            default=4,
+            type=int,
+            help='The number of parallel queries and batch writes. Defaults to 4.',
+        )
+        parser.add_argument(
+            '--write-capacity',
+            default=None,
+            type=int,
+            help='The maximum number of deleted items per second, by default the deletes are not limited.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            default=False,
+            help='Only count the revisions to delete.',
+        )
+
+    def get_deletable_revision_ids(self, revision_ids, object_versions, model_keys, keep):
+        deletable_revision_ids = set(revision_ids)
+        # Keep the revisions with the most recent versions of the objects.
+        if keep:
+            for versions in object_versions:
+                deletable_revision_ids.difference_update(
+                    version.revision_id for version in versions[:keep]
+                    if version.object_content_type_key in model_keys
+                )
+        # Keep revisions with keyframes of the remaining delta versions. Keyframes are versions of the same object.
+        while True:
+            keyframe_revision_ids = {
+                get_delta_keyframe_key(version.serialized_data)
+                for versions in object_versions
+                for version in versions
+                if version.revision_id not in deletable_revision_ids
+            } & deletable_revision_ids
+            if not keyframe_revision_ids:
+                return deletable_revision_ids
+            deletable_revision_ids -= keyframe_revision_ids
+
+    def get_unreferenced_payloads(self, deletable_revision_ids, object_versions):
+        payload_keys = {True: set(), False: set()}
+        for versions in object_versions:
+            for version in versions:
+                if version.payload_key:
+                    payload_keys[version.revision_id in deletable_revision_ids].add(version.payload_key)
+        # Payloads contain the serialized primary key, so only versions of the same object share them.
+        return [
+            VersionPayload(revision_id=get_payload_revision_id(payload_key), object_key=PAYLOAD_OBJ_KEY)
+            for payload_key in payload_keys[True] - payload_keys[False]
+        ]
+
+    def delete_items(self, items, write_budget):
+        write_budget.consume(len(items))
+        with Version.batch_write() as batch:
+            for item in items:
+                batch.delete(item)
+
+    def delete_revisions(self, executor, revision_ids, model_keys, walked_model_keys, keep, write_budget, dry_run):
+        """
+        Deletes the revisions which are not kept and returns the number of deleted revisions. Revisions already
+        deleted and revisions with versions of the models walked before are skipped.
+        """
+        revision_items = {
+            revision_id: items
+            for revision_id, items in zip(revision_ids, executor.map(_get_revision_items, revision_ids))
+            if items and not any(item.object_content_type_key in walked_model_keys for item in items)
+        }
+        revision_ids = list(revision_items)
+        if not revision_ids:
+            return 0
+        object_keys = {
+            item.object_key for items in revision_items.values() for item in items if item.object_content_type_key
+        }
+        object_versions = list(executor.map(_get_object_versions, object_keys))
+        deletable_revision_ids = self.get_deletable_revision_ids(revision_ids, object_versions, model_keys, keep)
+        if not dry_run:
+            items = [item for revision_id in deletable_revision_ids for item in revision_items[revision_id]]
+            items += self.get_unreferenced_payloads(deletable_revision_ids, object_versions)
+            list(executor.map(
+                lambda chunk: self.delete_items(chunk, write_budget),
+                [items[i:i + DELETE_CHUNK_SIZE] for i in range(0, len(items), DELETE_CHUNK_SIZE)],
+            ))
+        return len(deletable_revision_ids)
+
+    def handle(self, **options):
+        verbosity = options['verbosity']
+        model_db = options['model_db']
+        keep = options['keep']
+        dry_run = options['dry_run']
+        write_budget = WriteBudget(options['write_capacity'])
+        models = list(self.get_models(options))
+        model_keys = {
+            get_object_content_type_key(_get_content_type(model, None), model_db) for model in models
+        }
+        date_created = timezone.now() - timedelta(days=options['days'])
+        walked_model_keys = set()
+        deleted_count = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for model in models:
+                if verbosity >= 1:
+                    self.stdout.write('Deleting stale revisions for {name}'.format(
+                        name=model._meta.verbose_name,
+                    ))
+                # Newest versions are walked first, so delta versions are deleted before their keyframes are checked.
+                versions = Version.objects.get_for_model(model, model_db=model_db).filter(
+                    date_created__lt=date_created
+                ).set_scan_index_forward(False)
+                previous_revision_ids = set()
+                for page in iter_pages(versions, options['batch_size']):
+                    # Revisions are grouped from the versions of the page. Versions of a revision have the same date,
+                    # so a revision can continue only from the previous page of the index.
+                    page_revision_ids = {version.revision_id for version in page}
+                    revision_ids = list(page_revision_ids - previous_revision_ids)
+                    previous_revision_ids = page_revision_ids
+                    if revision_ids:
+                        deleted_count += self.delete_revisions(
+                            executor, revision_ids, model_keys, walked_model_keys, keep, write_budget, dry_run
+                        )
+                        if verbosity >= 2:
+                            self.stdout.write('- {action} {deleted_count} revisions'.format(
+                                action='Found' if dry_run else 'Deleted',
+                                deleted_count=deleted_count,
+                            ))
+                walked_model_keys.add(get_object_content_type_key(_get_content_type(model, None), model_db))
+        if verbosity >= 1:
+            self.stdout.write('{action} {deleted_count} revisions'.format(
+                action='Found' if dry_run else 'Deleted',
+                deleted_count=deleted_count,
+            ))
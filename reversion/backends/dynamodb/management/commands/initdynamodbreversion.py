@@ -2,6 +2,9 @@ from django.core.management.base import BaseCommand, CommandError
 
 from pydjamodb.connection import TableConnection
 
+from reversion.backends.dynamodb.models import ReversionDynamoModel
+from reversion.conf import get_config
+
 
 class Command(BaseCommand):
 
@@ -69,3 +72,5 @@ class Command(BaseCommand):
             },
             wait=True
         )
+        if get_config().dynamodb_ttl:
+            connection.update_time_to_live(ReversionDynamoModel.expires.attr_name)
@@ -0,0 +1,56 @@
+from reversion.backends.dynamodb.models import Version
+from reversion.backends.utils import get_content_hash
+from reversion.errors import RevertError
+from reversion.management.commands import BaseRevisionCommand
+
+
+class Command(BaseRevisionCommand):
+
+    help = "Stores content hashes of DynamoDB versions saved without them for a given app [and model]."
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--batch-size',
+            action='store',
+            type=int,
+            default=100,
+            help='Versions are loaded and written in batches. Defaults to 100.',
+        )
+
+    def update_versions(self, versions):
+        Version._prefetch_version_data(versions)
+        updated_count = 0
+        with Version.batch_write() as batch:
+            for version in versions:
+                try:
+                    content_hash = get_content_hash(version)
+                except RevertError:
+                    content_hash = None
+                if content_hash:
+                    batch.save(version)
+                    updated_count += 1
+        return updated_count
+
+    def handle(self, **options):
+        verbosity = options['verbosity']
+        batch_size = options['batch_size']
+        for model in self.get_models(options):
+            if verbosity >= 1:
+                self.stdout.write('Updating version hashes for {name}'.format(
+                    name=model._meta.verbose_name,
+                ))
+            updated_count = 0
+            chunk = []
+            for version in Version.objects.get_for_model(model, model_db=options['model_db']):
+                if not version.content_hash:
+                    chunk.append(version)
+                if len(chunk) >= batch_size:
+                    updated_count += self.update_versions(chunk)
+                    chunk = []
+            if chunk:
+                updated_count += self.update_versions(chunk)
+            if verbosity >= 1:
+                self.stdout.write('- Updated {updated_count} versions'.format(
+                    updated_count=updated_count,
+                ))
@@ -1,33 +1,37 @@
-from pynamodb.attributes import UnicodeAttribute, UTCDateTimeAttribute
+from pynamodb.attributes import TTLAttribute, UnicodeAttribute, UTCDateTimeAttribute
 from pynamodb.indexes import AllProjection, GlobalSecondaryIndex
 
 from pydjamodb.models import DynamoModel
 from pydjamodb.attributes import BooleanUnicodeAttribute
 from pydjamodb.queryset import DynamoDBManager
 
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from uuid import uuid4
 
-from django.core import serializers
 from django.contrib.contenttypes.models import ContentType
+from django.core.serializers.base import DeserializationError
 from django.db import router
 from django.utils.encoding import force_str
 from django.utils.functional import cached_property
 
-from reversion.backends.utils import get_object_version, get_local_field_dict, get_raw_field_dict
-from reversion.revisions import _get_options
+from reversion.backends.utils import (
+    get_object_version, get_local_field_dict, get_raw_field_dict, get_serialized_data, get_delta_data,
+    get_delta_keyframe_key, get_payload_hash, get_content_hash
+)
+from reversion.compression import compress
+from reversion.conf import get_config
+from reversion.revisions import _get_content_type
 from reversion.signals import pre_revision_commit, post_revision_commit
 
 from .queryset import (
-    ObjectVersionDynamoDBQuerySet, RevisionDynamoDBQuerySet, ObjectVersionRevisionDynamoDBQuerySet, NULL_OBJ_KEY
+    ObjectVersionDynamoDBQuerySet, RevisionDynamoDBQuerySet, ObjectVersionRevisionDynamoDBQuerySet, NULL_OBJ_KEY,
+    PAYLOAD_OBJ_KEY
 )
 
 
-def _get_content_type(model, using=None):
-    version_options = _get_options(model)
-    return ContentType.objects.db_manager(using).get_for_model(
-        model,
-        for_concrete_model=version_options.for_concrete_model,
-    )
+# Number of parallel index queries of the latest versions of objects.
+LATEST_VERSIONS_WORKERS = 10
 
 
 def get_key_from_content_type_and_id(content_type, object_id, model_db=None):
@@ -39,7 +43,7 @@ def get_key_from_object(obj, model_db=None):
     if not obj:
         return NULL_OBJ_KEY
     else:
-        return get_key_from_content_type_and_id(_get_content_type(obj), obj.pk, model_db)
+        return get_key_from_content_type_and_id(_get_content_type(obj.__class__, None), obj.pk, model_db)
 
 
 def get_object_from_key_or_none(object_key):
@@ -53,6 +57,10 @@ def get_object_from_key_or_none(object_key):
     ).model_class().objects.using(model_db).filter(pk=object_id).first()
 
 
+def get_payload_revision_id(payload_hash):
+    return 'payload|{}'.format(payload_hash)
+
+
 def get_object_content_type_key(content_type, model_db=None):
     model_db = model_db or router.db_for_write(content_type.model_class())
     return '{}|{}'.format(model_db, content_type.pk)
@@ -98,6 +106,9 @@ class ReversionDynamoModel(DynamoModel):
     serialized_data = UnicodeAttribute(null=True)
     object_repr = UnicodeAttribute(null=True)
     is_removed = BooleanUnicodeAttribute(null=True)
+    payload_key = UnicodeAttribute(null=True)
+    content_hash = UnicodeAttribute(null=True)
+    expires = TTLAttribute(null=True)
 
     object_date_created_index = VersionObjectDateCreatedIndex()
     object_content_type_key_removed_index = RemovedVersionIndex()
@@ -116,6 +127,8 @@ class ReversionDynamoModel(DynamoModel):
 
         if data['object_key']['S'] == NULL_OBJ_KEY:
             return Revision._instantiate(data)
+        elif data['object_key']['S'] == PAYLOAD_OBJ_KEY:
+            return VersionPayload._instantiate(data)
         else:
             return Version._instantiate(data)
 
@@ -140,6 +153,14 @@ class Revision(ReversionDynamoModel):
         return Version.objects_all.set_hash_key(self.revision_id).filter(object_key__startswith='VERSION')
 
 
+class VersionPayload(ReversionDynamoModel):
+
+    """Serialized data shared by versions with the same content, stored under the ``payload|<hash>`` key."""
+
+    class Meta:
+        proxy = True
+
+
 class Version(ReversionDynamoModel):
 
     objects = ObjectVersionDynamoDBQuerySet.as_manager()
@@ -152,17 +173,74 @@ class Version(ReversionDynamoModel):
     def revision(self):
         return Revision.get(self.revision_id, NULL_OBJ_KEY)
 
+    @classmethod
+    def _prefetch_version_data(cls, versions):
+        """Loads the payloads of deduplicated versions and the keyframes of delta versions with batch gets."""
+        payload_versions = defaultdict(list)
+        delta_versions = defaultdict(list)
+        for version in versions:
+            if version.payload_key and '_payload' not in version.__dict__:
+                payload_versions[get_payload_revision_id(version.payload_key)].append(version)
+            if '_keyframe' not in version.__dict__:
+                keyframe_key = get_delta_keyframe_key(version.serialized_data)
+                if keyframe_key is not None:
+                    delta_versions[(keyframe_key, version.object_key)].append(version)
+        if delta_versions:
+            keyframes = {(version.revision_id, version.object_key): version for version in versions}
+            missing_keys = [key for key in delta_versions if key not in keyframes]
+            if missing_keys:
+                keyframes.update(
+                    ((keyframe.revision_id, keyframe.object_key), keyframe) for keyframe in cls.batch_get(missing_keys)
+                )
+            for key, keyframe_versions in delta_versions.items():
+                for version in keyframe_versions:
+                    version.__dict__['_keyframe'] = keyframes.get(key)
+        if payload_versions:
+            for payload in VersionPayload.batch_get([(key, PAYLOAD_OBJ_KEY) for key in payload_versions]):
+                for version in payload_versions[payload.revision_id]:
+                    version.__dict__['_payload'] = payload
+
+    @cached_property
+    def _payload(self):
+        try:
+            return VersionPayload.get(get_payload_revision_id(self.payload_key), PAYLOAD_OBJ_KEY)
+        except VersionPayload.DoesNotExist:
+            return None
+
+    @property
+    def _stored_data(self):
+        if not self.payload_key:
+            return self.serialized_data
+        if self._payload is None:
+            raise DeserializationError('Missing payload of the deduplicated version')
+        return self._payload.serialized_data
+
+    @property
+    def _keyframe_key(self):
+        return self.revision_id
+
+    @cached_property
+    def _keyframe(self):
+        try:
+            return Version.get(get_delta_keyframe_key(self.serialized_data), self.object_key)
+        except Version.DoesNotExist:
+            return None
+
+    @cached_property
+    def _serialized_data(self):
+        return get_serialized_data(self)
+
     @cached_property
     def _object_version(self):
-        return get_object_version(self._model, self.serialized_data, self.object_repr, self.format)
+        return get_object_version(self._model, self._serialized_data, self.object_repr, self.format)
 
     @cached_property
     def _local_field_dict(self):
-        return get_local_field_dict(self._model, self._object_version)
+        return get_local_field_dict(self._model, self)
 
     @cached_property
     def _local_raw_field_dict(self):
-        return get_raw_field_dict(self.serialized_data, self.object_repr, self.format)
+        return get_raw_field_dict(self._serialized_data, self.object_repr, self.format)
 
     def _get_parent_version_list(self):
         parent_version_list = []
@@ -172,7 +250,7 @@ class Version(ReversionDynamoModel):
                 else self._local_field_dict.get(field.attname)
             )
             if parent_id:
-                content_type = _get_content_type(parent_model)
+                content_type = _get_content_type(parent_model, None)
                 try:
                     parent_version_list.append(Version.get(
                         self.revision_id,
@@ -220,7 +298,7 @@ class Version(ReversionDynamoModel):
     def content_type_id(self):
         return int(self.object_key.split('|')[1])
 
-    @property
+    @cached_property
     def _content_type(self):
         return ContentType.objects.get_for_id(self.content_type_id)
 
@@ -255,71 +333,174 @@ class Version(ReversionDynamoModel):
 
 
 def prepare_version_object(obj, content_type, object_id, model_db, version_options, explicit, using, is_delete):
-    object_key = get_key_from_content_type_and_id(content_type, object_id, model_db)
     version = Version(
-        object_key=object_key,
+        object_key=get_key_from_content_type_and_id(content_type, object_id, model_db),
         format=version_options.format,
-        serialized_data=serializers.serialize(
-            version_options.format,
-            (obj,),
-            fields=version_options.fields,
-            use_natural_foreign_keys=version_options.use_natural_foreign_keys,
-        ),
         object_repr=force_str(obj),
         is_removed=True if is_delete else None,
         object_content_type_key=get_object_content_type_key(content_type, model_db)
     )
+    version.__dict__['_serialized_data'] = version_options.serializer(obj)
+    return version
 
-    if version_options.ignore_duplicates and explicit:
-        previous_version = Version.objects.set_index(
-            Version.object_date_created_index
-        ).filter(object=object_key).first()
-        if not is_delete and previous_version and previous_version._local_field_dict == version._local_field_dict:
-            return None
 
-    return version
+def _get_latest_version(object_key):
+    return Version.objects.set_hash_key(object_key).first()
+
+
+def get_latest_versions(versions, using):
+    """Returns the latest saved versions of the objects of the versions, the index is queried in parallel."""
+    object_keys = list({version.object_key for version in versions})
+    if not object_keys:
+        return []
+    with ThreadPoolExecutor(max_workers=min(len(object_keys), LATEST_VERSIONS_WORKERS)) as executor:
+        latest_versions = dict(zip(object_keys, executor.map(_get_latest_version, object_keys)))
+    return [latest_versions[version.object_key] for version in versions]
+
+
+def iter_versions_at(model, date, model_db=None, using=None):
+    """Streams the latest versions created at or before the date of every object of the model."""
+    return Version.objects.get_for_model_at(model, date, model_db=model_db)
+
+
+def _is_versioned(object_key):
+    return Version.objects.set_hash_key(object_key).exists()
+
+
+def iter_unversioned_object_ids(model, model_db=None, using=None, batch_size=500):
+    """
+    Yields the primary keys of the objects of the model without versions in chunks ordered by the primary key. The
+    object index is queried in parallel for every chunk of the primary keys, only one chunk is kept in memory.
+    Batch gets cannot read an index, so every object costs one index query.
+    """
+    model_db = model_db or router.db_for_write(model)
+    content_type = _get_content_type(model, None)
+    pks = model._default_manager.using(model_db).order_by('pk').values_list('pk', flat=True)
+    with ThreadPoolExecutor(max_workers=LATEST_VERSIONS_WORKERS) as executor:
+        chunk = list(pks[:batch_size])
+        while chunk:
+            object_keys = [get_key_from_content_type_and_id(content_type, pk, model_db) for pk in chunk]
+            unversioned_pks = [
+                pk for pk, is_versioned in zip(chunk, executor.map(_is_versioned, object_keys)) if not is_versioned
+            ]
+            if unversioned_pks:
+                yield unversioned_pks
+            chunk = list(pks.filter(pk__gt=chunk[-1])[:batch_size])
+
+
+def _set_stored_data(version):
+    version_options = version._version_options
+    data = version._serialized_data
+    # The content hash is stored in the version.
+    get_content_hash(version)
+    delta_data = None
+    if version_options.delta:
+        delta_data, version.__dict__['_keyframe'] = get_delta_data(
+            version_options, data, getattr(version, '_previous_version', None)
+        )
+    if delta_data is not None:
+        version.serialized_data = delta_data
+    elif version_options.deduplicate:
+        # The payload item is saved with the revision, items with the same key have the same content.
+        version.payload_key = get_payload_hash(data)
+        version.__dict__['_payload'] = VersionPayload(
+            revision_id=get_payload_revision_id(version.payload_key),
+            object_key=PAYLOAD_OBJ_KEY,
+            serialized_data=compress(data, version_options.compress),
+        )
+    else:
+        version.serialized_data = compress(data, version_options.compress)
 
 
 def save_revision(date_created, user, comment, versions, using):
-    from reversion.revisions import create_revision
+    return save_revisions(date_created, user, comment, [versions], using)[0]
+
+
+def _get_keyframe_items(keyframe):
+    """Returns the keyframe version with the header item of its revision and its payload, they expire together."""
+    items = [keyframe]
+    try:
+        items.append(keyframe.revision)
+    except Revision.DoesNotExist:
+        pass
+    if keyframe.payload_key and keyframe._payload is not None:
+        items.append(keyframe._payload)
+    return items
+
 
-    # Generate random revision PK
-    revision_id = str(uuid4())
+def save_revisions(date_created, user, comment, revision_versions, using):
+    """Saves a revision for every list of versions, the items of all revisions are saved with one batch write."""
+    from reversion.revisions import create_revision
 
     user_key = get_key_from_object(user)
 
-    revision = ReversionDynamoModel(
-        revision_id=revision_id,
-        object_key=NULL_OBJ_KEY,
-        date_created=date_created,
-        user_key=user_key,
-        comment=comment
-    )
+    ttl = get_config().dynamodb_ttl
+    expires = date_created + ttl if ttl else None
+
+    revisions = [
+        ReversionDynamoModel(
+            # Generate random revision PK
+            revision_id=str(uuid4()),
+            object_key=NULL_OBJ_KEY,
+            date_created=date_created,
+            user_key=user_key,
+            comment=comment,
+            expires=expires
+        )
+        for _ in revision_versions
+    ]
+    for revision, versions in zip(revisions, revision_versions):
+        for version in versions:
+            _set_stored_data(version)
 
-    # Send the pre_revision_commit signal.
-    pre_revision_commit.send(
-        sender=create_revision,
-        revision=revision,
-        versions=versions
-    )
+        # Send the pre_revision_commit signal.
+        pre_revision_commit.send(
+            sender=create_revision,
+            revision=revision,
+            versions=versions
+        )
 
     # Save version models.
     with Version.batch_write() as batch:
-        batch.save(revision)
+        payloads = {}
+        keyframe_items = {}
+        for revision, versions in zip(revisions, revision_versions):
+            batch.save(revision)
+            payloads.update(
+                (version._payload.revision_id, version._payload) for version in versions if version.payload_key
+            )
 
-        for version in versions:
-            version.revision_id = revision_id
-            version.date_created = date_created
-            version.user_key = user_key
-            version.comment = comment
-            batch.save(version)
-    post_revision_commit.send(
-        sender=create_revision,
-        revision=revision,
-        versions=versions,
-        revision_id=revision_id
-    )
-    return revision_id
+            for version in versions:
+                version.revision_id = revision.revision_id
+                version.date_created = date_created
+                version.user_key = user_key
+                version.comment = comment
+                version.expires = expires
+                batch.save(version)
+                # Keyframes of delta versions expire with the latest delta version.
+                if expires and get_delta_keyframe_key(version.serialized_data) is not None:
+                    keyframe = version._keyframe
+                    if keyframe is not None and keyframe.expires and keyframe.expires < expires:
+                        keyframe_items.update(
+                            ((item.revision_id, item.object_key), item) for item in _get_keyframe_items(keyframe)
+                        )
+
+        for payload in payloads.values():
+            payload.date_created = date_created
+            payload.expires = expires
+            batch.save(payload)
+        for key, item in keyframe_items.items():
+            if key[0] not in payloads:
+                item.expires = expires
+                batch.save(item)
+    for revision, versions in zip(revisions, revision_versions):
+        post_revision_commit.send(
+            sender=create_revision,
+            revision=revision,
+            versions=versions,
+            revision_id=revision.revision_id
+        )
+    return [revision.revision_id for revision in revisions]
 
 
 def get_db_name():
@@ -331,3 +512,7 @@ def get_revision_or_none(id):
         return Revision.get(id, NULL_OBJ_KEY)
     except Version.DoesNotExist:
         return None
+
+
+def get_version_queryset(using=None):
+    return Version.objects.get_queryset()
@@ -2,8 +2,23 @@ from itertools import zip_longest
 
 from pydjamodb.queryset import DynamoDBQuerySet
 
+from reversion.revisions import _get_content_type
+
 
 NULL_OBJ_KEY = '-'
+PAYLOAD_OBJ_KEY = 'PAYLOAD'
+
+
+def iter_pages(queryset, page_size=100):
+    """Yields the results of the queryset page by page, only one page is loaded at once."""
+    queryset = queryset.set_limit(page_size)
+    last_evaluated_key = None
+    while True:
+        page = queryset.set_last_evaluated_key(last_evaluated_key)
+        yield list(page)
+        last_evaluated_key = page.next_key
+        if not last_evaluated_key:
+            return
 
 
 class ObjectVersionDynamoDBQuerySet(DynamoDBQuerySet):
@@ -77,29 +92,49 @@ class ObjectVersionDynamoDBQuerySet(DynamoDBQuerySet):
             self._process_execution_with_prefetch_prev_version()
         else:
             super()._process_execution()
+        self._model._prefetch_version_data(self._results)
 
     def get_for_object_reference(self, model, object_id, model_db=None):
-        from .models import get_key_from_content_type_and_id, _get_content_type
+        from .models import get_key_from_content_type_and_id
 
         return self.set_hash_key(
-            get_key_from_content_type_and_id(_get_content_type(model), object_id, model_db)
+            get_key_from_content_type_and_id(_get_content_type(model, None), object_id, model_db)
         )
 
     def get_for_object(self, obj, model_db=None):
         return self.get_for_object_reference(obj.__class__, obj.pk, model_db=model_db)
 
     def get_for_model(self, model, model_db=None):
-        from .models import get_object_content_type_key, _get_content_type
+        from .models import get_object_content_type_key
 
         return self._model.objects_all.set_index(self._model.object_content_type_created_index).set_hash_key(
-            get_object_content_type_key(_get_content_type(model), model_db)
+            get_object_content_type_key(_get_content_type(model, None), model_db)
         )
 
+    def get_for_model_at(self, model, date, model_db=None, page_size=100):
+        """
+        Yields the latest versions created at or before the date of every object of the model. The model index is
+        queried newest first page by page, objects removed at the date are skipped.
+        """
+        queryset = self.get_for_model(model, model_db=model_db).filter(
+            date_created__lte=date
+        ).set_scan_index_forward(False)
+        seen_object_keys = set()
+        for page in iter_pages(queryset, page_size):
+            versions = []
+            for version in page:
+                if version.object_key not in seen_object_keys:
+                    seen_object_keys.add(version.object_key)
+                    if not version.is_delete:
+                        versions.append(version)
+            self._model._prefetch_version_data(versions)
+            yield from versions
+
     def get_deleted(self, model, model_db=None):
-        from .models import get_object_content_type_key, _get_content_type
+        from .models import get_object_content_type_key
 
         return self._model.objects_all.set_index(self._model.object_content_type_key_removed_index).set_hash_key(
-            get_object_content_type_key(_get_content_type(model), model_db)
+            get_object_content_type_key(_get_content_type(model, None), model_db)
         )
 
 
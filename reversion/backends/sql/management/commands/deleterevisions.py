@@ -1,8 +1,12 @@
+from collections import defaultdict
 from datetime import timedelta
 from django.db import transaction, models, router
+from django.db.models.functions import Left, RowNumber
 from django.utils import timezone
-from reversion.backends.sql.models import Revision, Version
-from reversion.backends.sql.management.commands import BaseRevisionCommand
+from reversion.backends.sql.models import Revision, Version, VersionPayload
+from reversion.backends.utils import get_delta_keyframe_key
+from reversion.management.commands import BaseRevisionCommand
+from reversion.revisions import _get_content_type
 
 
 class Command(BaseRevisionCommand):
@@ -23,6 +27,59 @@ class Command(BaseRevisionCommand):
             type=int,
             help="Keep the specified number of revisions (most recent) for each object.",
         )
+        parser.add_argument(
+            "--batch-size",
+            action="store",
+            type=int,
+            default=500,
+            help="Revisions are deleted in batches, every batch in a transaction. Defaults to 500.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            default=False,
+            help="Only count the revisions and payloads to delete.",
+        )
+
+    def get_deletable_revision_ids(self, using, revision_ids, model_keys, keep):
+        """
+        Returns the revisions of the chunk which can be deleted. All versions of the objects in the chunk are loaded
+        with one query, numbered from the most recent version of every object.
+        """
+        db_object_ids = defaultdict(set)
+        for content_type_id, db, object_id in Version.objects.using(using).filter(
+            revision_id__in=revision_ids,
+        ).order_by().values_list("content_type_id", "db", "object_id").distinct():
+            db_object_ids[(content_type_id, db)].add(object_id)
+        object_query = models.Q()
+        for (content_type_id, db), object_ids in db_object_ids.items():
+            object_query |= models.Q(content_type_id=content_type_id, db=db, object_id__in=object_ids)
+        object_versions = list(Version.objects.using(using).filter(object_query).order_by().annotate(
+            row_number=models.Window(
+                expression=RowNumber(),
+                partition_by=[models.F("content_type_id"), models.F("db"), models.F("object_id")],
+                order_by=models.F("pk").desc(),
+            ),
+            data_prefix=Left("serialized_data", 40),
+        ).values_list("pk", "revision_id", "content_type_id", "db", "row_number", "data_prefix"))
+        deletable_revision_ids = set(revision_ids)
+        # Keep the revisions with the most recent versions of the objects.
+        if keep:
+            deletable_revision_ids.difference_update(
+                revision_id for _, revision_id, content_type_id, db, row_number, _ in object_versions
+                if (content_type_id, db) in model_keys and row_number <= keep
+            )
+        # Keep revisions with keyframes of the remaining delta versions. Keyframes are versions of the same object.
+        version_revision_ids = {str(pk): revision_id for pk, revision_id, *_ in object_versions}
+        while True:
+            keyframe_revision_ids = {
+                version_revision_ids.get(get_delta_keyframe_key(data_prefix))
+                for _, revision_id, *_, data_prefix in object_versions
+                if revision_id not in deletable_revision_ids
+            } & deletable_revision_ids
+            if not keyframe_revision_ids:
+                return deletable_revision_ids
+            deletable_revision_ids -= keyframe_revision_ids
 
     def handle(self, *app_labels, **options):
         verbosity = options["verbosity"]
@@ -30,65 +87,74 @@ class Command(BaseRevisionCommand):
         model_db = options["model_db"]
         days = options["days"]
         keep = options["keep"]
-        # Delete revisions.
+        batch_size = options["batch_size"]
+        dry_run = options["dry_run"]
         using = using or router.db_for_write(Revision)
-        with transaction.atomic(using=using):
-            revision_query = models.Q()
-            keep_revision_ids = set()
-            # By default, delete nothing.
-            can_delete = False
-            # Get all revisions for the given revision manager and model.
-            for model in self.get_models(options):
-                if verbosity >= 1:
-                    self.stdout.write("Finding stale revisions for {name}".format(
-                        name=model._meta.verbose_name,
-                    ))
-                # Find all matching revision IDs.
-                model_query = Version.objects.using(using).get_for_model(
-                    model,
-                    model_db=model_db,
-                )
-                if keep:
-                    overflow_object_ids = list(Version.objects.using(using).get_for_model(
-                        model,
-                        model_db=model_db,
-                    ).order_by().values_list("object_id").annotate(
-                        count=models.Count("object_id"),
-                    ).filter(
-                        count__gt=keep,
-                    ).values_list("object_id", flat=True).iterator())
-                    # Only delete overflow revisions.
-                    model_query = model_query.filter(object_id__in=overflow_object_ids)
-                    for object_id in overflow_object_ids:
-                        if verbosity >= 2:
-                            self.stdout.write("- Finding stale revisions for {name} #{object_id}".format(
-                                name=model._meta.verbose_name,
-                                object_id=object_id,
-                            ))
-                        # But keep the underflow revisions.
-                        keep_revision_ids.update(Version.objects.using(using).get_for_object_reference(
-                            model,
-                            object_id,
-                            model_db=model_db,
-                        ).values_list("revision_id", flat=True)[:keep].iterator())
-                # Add to revision query.
-                revision_query |= models.Q(
-                    pk__in=model_query.order_by().values_list("revision_id", flat=True)
-                )
-                # If we have at least one model, then we can delete.
-                can_delete = True
-            if can_delete:
-                revisions_to_delete = Revision.objects.using(using).filter(
-                    revision_query,
-                    date_created__lt=timezone.now() - timedelta(days=days),
-                ).exclude(
-                    pk__in=keep_revision_ids
-                ).order_by()
-            else:
-                revisions_to_delete = Revision.objects.using(using).none()
-            # Print out a message, if feeling verbose.
+        # Find versions of all the given models.
+        version_query = models.Q()
+        model_keys = set()
+        for model in self.get_models(options):
             if verbosity >= 1:
-                self.stdout.write("Deleting {total} revisions...".format(
-                    total=revisions_to_delete.count(),
+                self.stdout.write("Finding stale revisions for {name}".format(
+                    name=model._meta.verbose_name,
                 ))
-            revisions_to_delete.delete()
+            model_key = (_get_content_type(model, using).pk, model_db or router.db_for_write(model))
+            version_query |= models.Q(content_type_id=model_key[0], db=model_key[1])
+            model_keys.add(model_key)
+        # Delete revisions in chunks, every chunk is committed separately. Newest revisions are deleted first, so delta
+        # versions are deleted before the chunk with their keyframes is checked.
+        deleted_count = 0
+        if model_keys:
+            revision_ids = Version.objects.using(using).filter(
+                version_query,
+                revision__date_created__lt=timezone.now() - timedelta(days=days),
+            ).order_by("-revision_id").values_list("revision_id", flat=True).distinct()
+            last_revision_id = None
+            while True:
+                chunk = list((
+                    revision_ids if last_revision_id is None else revision_ids.filter(revision_id__lt=last_revision_id)
+                )[:batch_size])
+                if not chunk:
+                    break
+                last_revision_id = chunk[-1]
+                with transaction.atomic(using=using):
+                    deletable_revision_ids = self.get_deletable_revision_ids(using, chunk, model_keys, keep)
+                    if deletable_revision_ids and not dry_run:
+                        Revision.objects.using(using).filter(pk__in=deletable_revision_ids).delete()
+                deleted_count += len(deletable_revision_ids)
+                if verbosity >= 2:
+                    self.stdout.write("- {action} {deleted_count} revisions".format(
+                        action="Found" if dry_run else "Deleted",
+                        deleted_count=deleted_count,
+                    ))
+        # Print out a message, if feeling verbose.
+        if verbosity >= 1:
+            self.stdout.write("{action} {deleted_count} revisions".format(
+                action="Found" if dry_run else "Deleted",
+                deleted_count=deleted_count,
+            ))
+        # Delete payloads of deduplicated versions, that are no longer referenced by any version.
+        payload_hashes = VersionPayload.objects.using(using).filter(
+            ~models.Exists(Version.objects.using(using).filter(payload=models.OuterRef("pk"))),
+        ).order_by("pk").values_list("pk", flat=True)
+        deleted_count = 0
+        last_hash = ""
+        while True:
+            chunk = list(payload_hashes.filter(pk__gt=last_hash)[:batch_size])
+            if not chunk:
+                break
+            last_hash = chunk[-1]
+            if not dry_run:
+                with transaction.atomic(using=using):
+                    # The payloads are locked and checked again, versions saved meanwhile can reference them.
+                    list(VersionPayload.objects.using(using).select_for_update().filter(
+                        pk__in=chunk,
+                    ).order_by("pk").values_list("pk", flat=True))
+                    chunk = list(payload_hashes.filter(pk__in=chunk))
+                    VersionPayload.objects.using(using).filter(pk__in=chunk).delete()
+            deleted_count += len(chunk)
+        if verbosity >= 1:
+            self.stdout.write("{action} {deleted_count} unreferenced payloads".format(
+                action="Found" if dry_run else "Deleted",
+                deleted_count=deleted_count,
+            ))
@@ -0,0 +1,65 @@
+from django.db import router
+from reversion.backends.sql.models import Version, _prefetch_version_data
+from reversion.backends.utils import get_content_hash
+from reversion.management.commands import BaseRevisionCommand
+from reversion.errors import RevertError
+
+
+class Command(BaseRevisionCommand):
+
+    help = "Stores content hashes of versions saved without them for a given app [and model]."
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--batch-size",
+            action="store",
+            type=int,
+            default=500,
+            help="Versions are updated in batches. Defaults to 500.",
+        )
+
+    def handle(self, *app_labels, **options):
+        verbosity = options["verbosity"]
+        using = options["using"] or router.db_for_write(Version)
+        model_db = options["model_db"]
+        batch_size = options["batch_size"]
+        for model in self.get_models(options):
+            if verbosity >= 1:
+                self.stdout.write("Updating version hashes for {name}".format(
+                    name=model._meta.verbose_name,
+                ))
+            versions = Version.objects.using(using).get_for_model(
+                model,
+                model_db=model_db,
+            ).filter(content_hash="").order_by("pk")
+            updated_count = skipped_count = 0
+            last_pk = 0
+            while True:
+                chunk = list(versions.filter(pk__gt=last_pk)[:batch_size])
+                if not chunk:
+                    break
+                last_pk = chunk[-1].pk
+                _prefetch_version_data(chunk, using)
+                updated_versions = []
+                for version in chunk:
+                    try:
+                        content_hash = get_content_hash(version)
+                    except RevertError:
+                        content_hash = None
+                    if content_hash:
+                        updated_versions.append(version)
+                    else:
+                        skipped_count += 1
+                Version.objects.using(using).bulk_update(updated_versions, ("content_hash",))
+                updated_count += len(updated_versions)
+                if verbosity >= 2:
+                    self.stdout.write("- Updated {updated_count} versions".format(
+                        updated_count=updated_count,
+                    ))
+            # Print out a message, if feeling verbose.
+            if verbosity >= 1:
+                self.stdout.write("- Updated {updated_count} versions, skipped {skipped_count}".format(
+                    updated_count=updated_count,
+                    skipped_count=skipped_count,
+                ))
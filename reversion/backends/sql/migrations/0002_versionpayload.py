@@ -0,0 +1,31 @@
+# Generated by Django 3.2 on 2026-10-17 18:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reversion_backends_sql', '0001_squashed_0004_auto_20160611_1202'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionPayload',
+            fields=[
+                ('hash', models.CharField(help_text='SHA-256 hash of the serialized data.', max_length=64,
+                                          primary_key=True, serialize=False)),
+                ('data', models.TextField(help_text='The serialized form of the model shared by versions.')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='version',
+            name='payload',
+            field=models.ForeignKey(blank=True,
+                                    help_text='Shared serialized data of a deduplicated version, serialized_data is '
+                                              'empty then.',
+                                    null=True, on_delete=django.db.models.deletion.PROTECT,
+                                    to='reversion_backends_sql.versionpayload'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.2 on 2026-10-17 18:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reversion_backends_sql', '0002_versionpayload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='version',
+            name='content_hash',
+            field=models.CharField(blank=True,
+                                   help_text="SHA-256 hash of the field values, empty if the format can't be decoded.",
+                                   max_length=64),
+        ),
+    ]
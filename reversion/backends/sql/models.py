@@ -1,42 +1,29 @@
 from collections import defaultdict
-from itertools import chain, groupby
+from itertools import islice
 
 from django.apps import apps
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from django.core import serializers
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import IntegrityError, connections, models, router, transaction
+from django.db import connections, models, router, transaction
 from django.db.models.deletion import Collector
 from django.db.models.functions import Cast
+from django.db.models.query import ModelIterable
 from django.utils.encoding import force_str
 from django.utils.functional import cached_property
-from django.utils.translation import ugettext
 from django.utils.translation import gettext_lazy as _
 
-from reversion.backends.utils import get_object_version, get_local_field_dict, get_raw_field_dict
-from reversion.errors import RevertError
+from reversion.backends.utils import (
+    get_object_version, get_local_field_dict, get_raw_field_dict, get_serialized_data, get_delta_data,
+    get_delta_keyframe_key, get_payload_hash, get_content_hash, _revert_versions, _bulk_revert
+)
+from reversion.compression import compress
+from reversion.conf import get_config
 from reversion.revisions import _follow_relations_recursive, _get_content_type
 from reversion.signals import pre_revision_commit, post_revision_commit
 
 
-def _safe_revert(versions):
-    unreverted_versions = []
-    for version in versions:
-        try:
-            with transaction.atomic(using=version.db):
-                version.revert()
-        except (IntegrityError, ObjectDoesNotExist):
-            unreverted_versions.append(version)
-    if len(unreverted_versions) == len(versions):
-        raise RevertError(ugettext("Could not save %(object_repr)s version - missing dependency.") % {
-            "object_repr": unreverted_versions[0],
-        })
-    if unreverted_versions:
-        _safe_revert(unreverted_versions)
-
-
 class Revision(models.Model):
 
     """A group of related serialized versions."""
@@ -69,39 +56,41 @@ class Revision(models.Model):
         except LookupError:
             return self.comment
 
-    def revert(self, delete=False):
+    def revert(self, delete=False, bulk=False):
         # Group the models by the database of the serialized model.
         versions_by_db = defaultdict(list)
-        for version in self.version_set.iterator():
+        # The versions are loaded at once, so the payloads and keyframes of the versions are prefetched.
+        for version in self.version_set.all():
             versions_by_db[version.db].append(version)
         # For each db, perform a separate atomic revert.
         for version_db, versions in versions_by_db.items():
             with transaction.atomic(using=version_db):
                 # Optionally delete objects no longer in the current revision.
                 if delete:
-                    # Get a set of all objects in this revision.
-                    old_revision = set()
+                    # Get a set of all objects in this revision, loaded with one query per model.
+                    model_object_ids = defaultdict(list)
                     for version in versions:
-                        model = version._model
-                        try:
-                            # Load the model instance from the same DB as it was saved under.
-                            old_revision.add(model._default_manager.using(version.db).get(pk=version.object_id))
-                        except model.DoesNotExist:
-                            pass
+                        model_object_ids[version._model].append(version.object_id)
+                    old_revision = set()
+                    for model, object_ids in model_object_ids.items():
+                        # Load the model instances from the same DB as they were saved under.
+                        old_revision.update(model._default_manager.using(version_db).in_bulk(object_ids).values())
                     # Calculate the set of all objects that are in the revision now.
-                    current_revision = chain.from_iterable(
-                        _follow_relations_recursive(obj)
-                        for obj in old_revision
-                    )
+                    current_revision = _follow_relations_recursive(list(old_revision))
                     # Delete objects that are no longer in the current revision.
                     collector = Collector(using=version_db)
-                    new_objs = [item for item in current_revision
-                                if item not in old_revision]
-                    for model, group in groupby(new_objs, type):
-                        collector.collect(list(group))
+                    model_new_objs = defaultdict(list)
+                    for item in current_revision:
+                        if item not in old_revision:
+                            model_new_objs[type(item)].append(item)
+                    for new_objs in model_new_objs.values():
+                        collector.collect(new_objs)
                     collector.delete()
                 # Attempt to revert all revisions.
-                _safe_revert(versions)
+                if bulk:
+                    _bulk_revert(versions, version_db)
+                else:
+                    _revert_versions(versions)
 
     def __str__(self):
         return ", ".join(force_str(version) for version in self.version_set.all())
@@ -128,6 +117,17 @@ class VersionQuerySet(models.QuerySet):
     def get_for_object(self, obj, model_db=None):
         return self.get_for_object_reference(obj.__class__, obj.pk, model_db=model_db)
 
+    def get_for_model_at(self, model, date, model_db=None):
+        """
+        Returns the latest versions created at or before the date of every object of the model. Versions are ordered
+        by the date of their revision, back-dated revisions are not ordered by the insertion.
+        """
+        versions = self.get_for_model(model, model_db=model_db).filter(revision__date_created__lte=date)
+        latest_pk = versions.filter(
+            object_id=models.OuterRef("object_id"),
+        ).order_by("-revision__date_created", "-pk").values("pk")[:1]
+        return versions.filter(pk=models.Subquery(latest_pk))
+
     def get_deleted(self, model, model_db=None):
         model_db = model_db or router.db_for_write(model)
         connection = connections[self.db]
@@ -158,13 +158,42 @@ class VersionQuerySet(models.QuerySet):
         # Perform the subquery.
         return self.filter(pk__in=subquery)
 
+    def _fetch_all(self):
+        prefetch_keyframes = self._result_cache is None and self._iterable_class is ModelIterable
+        super()._fetch_all()
+        if prefetch_keyframes:
+            _prefetch_version_data(self._result_cache, self.db)
+
     def get_unique(self):
         last_key = None
-        for version in self.iterator():
-            key = (version.object_id, version.content_type_id, version.db, version._local_field_dict)
-            if last_key != key:
-                yield version
-            last_key = key
+        versions = self.iterator()
+        while True:
+            chunk = list(islice(versions, 100))
+            if not chunk:
+                return
+            _prefetch_version_data([version for version in chunk if not version.content_hash], self.db)
+            for version in chunk:
+                # Versions are compared by their stored content hash, only versions without it are decoded.
+                content = get_content_hash(version) or version._local_field_dict
+                key = (version.object_id, version.content_type_id, version.db, content)
+                if last_key != key:
+                    yield version
+                last_key = key
+
+
+class VersionPayload(models.Model):
+
+    """Serialized data shared by versions with the same content."""
+
+    hash = models.CharField(
+        max_length=64,
+        primary_key=True,
+        help_text="SHA-256 hash of the serialized data.",
+    )
+
+    data = models.TextField(
+        help_text="The serialized form of the model shared by versions.",
+    )
 
 
 class Version(models.Model):
@@ -192,7 +221,7 @@ class Version(models.Model):
 
     is_delete = False
 
-    @property
+    @cached_property
     def _content_type(self):
         return ContentType.objects.db_manager(self._state.db).get_for_id(self.content_type_id)
 
@@ -224,17 +253,49 @@ class Version(models.Model):
         help_text="A string representation of the object.",
     )
 
+    payload = models.ForeignKey(
+        VersionPayload,
+        null=True,
+        blank=True,
+        on_delete=models.PROTECT,
+        help_text="Shared serialized data of a deduplicated version, serialized_data is empty then.",
+    )
+
+    content_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="SHA-256 hash of the field values, empty if the format can't be decoded.",
+    )
+
+    @property
+    def _stored_data(self):
+        return self.payload.data if self.payload_id else self.serialized_data
+
+    @property
+    def _keyframe_key(self):
+        return str(self.pk)
+
+    @cached_property
+    def _keyframe(self):
+        return Version.objects.using(self._state.db).filter(
+            pk=get_delta_keyframe_key(self.serialized_data)
+        ).first()
+
+    @cached_property
+    def _serialized_data(self):
+        return get_serialized_data(self)
+
     @cached_property
     def _object_version(self):
-        return get_object_version(self._model, self.serialized_data, self.object_repr, self.format)
+        return get_object_version(self._model, self._serialized_data, self.object_repr, self.format)
 
     @cached_property
     def _local_field_dict(self):
-        return get_local_field_dict(self._model, self._object_version)
+        return get_local_field_dict(self._model, self)
 
     @cached_property
     def _local_raw_field_dict(self):
-        return get_raw_field_dict(self.serialized_data, self.object_repr, self.format)
+        return get_raw_field_dict(self._serialized_data, self.object_repr, self.format)
 
     def _get_parent_version_list(self):
         field_dict = self._local_field_dict
@@ -310,42 +371,71 @@ class _Str(models.Func):
         return super().as_sql(compiler, connection)
 
 
+def _can_subquery(left_query, left_field_name, right_subquery, right_field_name):
+    left_field = left_query.model._meta.get_field(left_field_name)
+    right_field = right_subquery.model._meta.get_field(right_field_name)
+    # If the databases don't match, or it's not a supported database, the subquery cannot be used.
+    return left_query.db == right_subquery.db and (
+        left_field.get_internal_type() != right_field.get_internal_type() and
+        connections[left_query.db].vendor in ("sqlite", "postgresql")
+    )
+
+
 def _safe_subquery(method, left_query, left_field_name, right_subquery, right_field_name):
     right_subquery = right_subquery.order_by().values_list(right_field_name, flat=True)
     left_field = left_query.model._meta.get_field(left_field_name)
     right_field = right_subquery.model._meta.get_field(right_field_name)
-    # If the databases don't match, we have to do it in-memory.
-    # If it's not a supported database, we also have to do it in-memory.
-    if (
-        left_query.db != right_subquery.db or not
-        (
-            left_field.get_internal_type() != right_field.get_internal_type() and
-            connections[left_query.db].vendor in ("sqlite", "postgresql")
-        )
-    ):
-        return getattr(left_query, method)(**{
-            "{}__in".format(left_field_name): list(right_subquery.iterator()),
+    # If the left hand side is not a text field, we need to cast it.
+    if not isinstance(left_field, (models.CharField, models.TextField)):
+        left_field_name_str = "{}_str".format(left_field_name)
+        left_query = left_query.annotate(**{
+            left_field_name_str: _Str(left_field_name),
         })
-    else:
-        # If the left hand side is not a text field, we need to cast it.
-        if not isinstance(left_field, (models.CharField, models.TextField)):
-            left_field_name_str = "{}_str".format(left_field_name)
-            left_query = left_query.annotate(**{
-                left_field_name_str: _Str(left_field_name),
-            })
-            left_field_name = left_field_name_str
-        # If the right hand side is not a text field, we need to cast it.
-        if not isinstance(right_field, (models.CharField, models.TextField)):
-            right_field_name_str = "{}_str".format(right_field_name)
-            right_subquery = right_subquery.annotate(**{
-                right_field_name_str: _Str(right_field_name),
-            }).values_list(right_field_name_str, flat=True)
-            right_field_name = right_field_name_str
-        # Use Exists if running on the same DB, it is much much faster
-        exist_annotation_name = "{}_annotation_str".format(right_subquery.model._meta.db_table)
-        right_subquery = right_subquery.filter(**{right_field_name: models.OuterRef(left_field_name)})
-        left_query = left_query.annotate(**{exist_annotation_name: models.Exists(right_subquery)})
-        return getattr(left_query, method)(**{exist_annotation_name: True})
+        left_field_name = left_field_name_str
+    # If the right hand side is not a text field, we need to cast it.
+    if not isinstance(right_field, (models.CharField, models.TextField)):
+        right_field_name_str = "{}_str".format(right_field_name)
+        right_subquery = right_subquery.annotate(**{
+            right_field_name_str: _Str(right_field_name),
+        }).values_list(right_field_name_str, flat=True)
+        right_field_name = right_field_name_str
+    # Use Exists if running on the same DB, it is much much faster
+    exist_annotation_name = "{}_annotation_str".format(right_subquery.model._meta.db_table)
+    right_subquery = right_subquery.filter(**{right_field_name: models.OuterRef(left_field_name)})
+    left_query = left_query.annotate(**{exist_annotation_name: models.Exists(right_subquery)})
+    return getattr(left_query, method)(**{exist_annotation_name: True})
+
+
+def _prefetch_version_data(versions, using):
+    """Loads the payloads of deduplicated versions and the keyframes of delta versions with one query each."""
+    payload_versions = []
+    delta_versions = defaultdict(list)
+    for version in versions:
+        deferred_fields = version.get_deferred_fields()
+        if (
+            'payload' not in deferred_fields and version.payload_id is not None
+            and not Version.payload.field.is_cached(version)
+        ):
+            payload_versions.append(version)
+        if '_keyframe' not in version.__dict__ and 'serialized_data' not in deferred_fields:
+            keyframe_key = get_delta_keyframe_key(version.serialized_data)
+            if keyframe_key is not None:
+                delta_versions[keyframe_key].append(version)
+    if delta_versions:
+        keyframes = {version._keyframe_key: version for version in versions}
+        missing_keys = [
+            keyframe_key for keyframe_key in delta_versions
+            if keyframe_key not in keyframes and keyframe_key.isdigit()
+        ]
+        if missing_keys:
+            keyframes.update(
+                (str(pk), keyframe) for pk, keyframe in Version.objects.using(using).in_bulk(missing_keys).items()
+            )
+        for keyframe_key, keyframe_versions in delta_versions.items():
+            for version in keyframe_versions:
+                version.__dict__['_keyframe'] = keyframes.get(keyframe_key)
+    if payload_versions:
+        models.prefetch_related_objects(payload_versions, 'payload')
 
 
 def prepare_version_object(obj, content_type, object_id, model_db, version_options, explicit, using, is_delete):
@@ -357,48 +447,153 @@ def prepare_version_object(obj, content_type, object_id, model_db, version_optio
         object_id=object_id,
         db=model_db,
         format=version_options.format,
-        serialized_data=serializers.serialize(
-            version_options.format,
-            (obj,),
-            fields=version_options.fields,
-            use_natural_foreign_keys=version_options.use_natural_foreign_keys,
-        ),
         object_repr=force_str(obj),
     )
-    if version_options.ignore_duplicates and explicit:
-        previous_version = Version.objects.using(using).get_for_object(obj, model_db=model_db).first()
-        if previous_version and previous_version._local_field_dict == version._local_field_dict:
-            return None
+    version.__dict__['_serialized_data'] = version_options.serializer(obj)
     return version
 
 
+def get_latest_versions(versions, using):
+    """Returns the latest saved versions of the objects of the versions, loaded with one query."""
+    object_query = models.Q()
+    db_object_ids = defaultdict(set)
+    for version in versions:
+        db_object_ids[(version.content_type_id, version.db)].add(version.object_id)
+    for (content_type_id, db), object_ids in db_object_ids.items():
+        object_query |= models.Q(content_type_id=content_type_id, db=db, object_id__in=object_ids)
+    latest_pks = Version.objects.using(using).filter(object_query).order_by().values(
+        "content_type", "db", "object_id",
+    ).annotate(
+        latest_pk=models.Max("pk"),
+    ).values("latest_pk")
+    latest_versions = {
+        (version.content_type_id, version.db, version.object_id): version
+        for version in Version.objects.using(using).filter(pk__in=latest_pks)
+    }
+    return [latest_versions.get((version.content_type_id, version.db, version.object_id)) for version in versions]
+
+
+def iter_versions_at(model, date, model_db=None, using=None, chunk_size=100):
+    """Streams the latest versions created at or before the date of every object of the model."""
+    versions = Version.objects.using(using).get_for_model_at(model, date, model_db=model_db).order_by("pk").iterator(
+        chunk_size=chunk_size,
+    )
+    while True:
+        chunk = list(islice(versions, chunk_size))
+        if not chunk:
+            return
+        _prefetch_version_data(chunk, using)
+        yield from chunk
+
+
+def iter_unversioned_object_ids(model, model_db=None, using=None, batch_size=500):
+    """Yields the primary keys of the objects of the model without versions in chunks ordered by the primary key."""
+    model_db = model_db or router.db_for_write(model)
+    objs = model._default_manager.using(model_db)
+    versions = Version.objects.using(using).get_for_model(model, model_db=model_db)
+    pk_name = model._meta.pk.name
+    if _can_subquery(objs, pk_name, versions, "object_id"):
+        # Versioned objects are excluded by the database.
+        pks = _safe_subquery("exclude", objs, pk_name, versions, "object_id").order_by("pk").values_list(
+            "pk", flat=True,
+        )
+        chunk = list(pks[:batch_size])
+        while chunk:
+            yield chunk
+            chunk = list(pks.filter(pk__gt=chunk[-1])[:batch_size])
+    else:
+        # Anti-join of the objects and their versions in chunks, only the ids of one chunk are kept in memory.
+        pks = objs.order_by("pk").values_list("pk", flat=True)
+        chunk = list(pks[:batch_size])
+        while chunk:
+            versioned_object_ids = set(versions.filter(
+                object_id__in=[force_str(pk) for pk in chunk],
+            ).order_by().values_list("object_id", flat=True))
+            unversioned_pks = [pk for pk in chunk if force_str(pk) not in versioned_object_ids]
+            if unversioned_pks:
+                yield unversioned_pks
+            chunk = list(pks.filter(pk__gt=chunk[-1])[:batch_size])
+
+
+def _set_stored_data(version):
+    version_options = version._version_options
+    data = version._serialized_data
+    version.content_hash = get_content_hash(version) or ''
+    delta_data = None
+    if version_options.delta:
+        delta_data, version.__dict__['_keyframe'] = get_delta_data(
+            version_options, data, getattr(version, '_previous_version', None)
+        )
+    if delta_data is not None:
+        version.serialized_data = delta_data
+    elif version_options.deduplicate:
+        # The payload is saved with the revision, only if a payload with the same hash does not exist yet.
+        version.payload = VersionPayload(hash=get_payload_hash(data), data=compress(data, version_options.compress))
+        version.serialized_data = ''
+    else:
+        version.serialized_data = compress(data, version_options.compress)
+
+
 def save_revision(date_created, user, comment, versions, using):
+    return save_revisions(date_created, user, comment, [versions], using)[0]
+
+
+def save_revisions(date_created, user, comment, revision_versions, using):
+    """Saves a revision for every list of versions, the versions of all revisions are inserted with bulk queries."""
     from reversion.revisions import create_revision
 
-    revision = Revision(
-        date_created=date_created,
-        user=user,
-        comment=comment,
-    )
-    # Send the pre_revision_commit signal.
-    pre_revision_commit.send(
-        sender=create_revision,
-        revision=revision,
-        versions=versions,
-    )
-    # Save the revision.
-    revision.save(using=using)
-    # Save version models.
-    for version in versions:
-        version.revision = revision
-        version.save(using=using)
-    post_revision_commit.send(
-        sender=create_revision,
-        revision=revision,
-        versions=versions,
-        revision_id=revision.id
-    )
-    return revision.pk
+    revisions = [
+        Revision(
+            date_created=date_created,
+            user=user,
+            comment=comment,
+        )
+        for _ in revision_versions
+    ]
+    for revision, versions in zip(revisions, revision_versions):
+        for version in versions:
+            _set_stored_data(version)
+        # Send the pre_revision_commit signal.
+        pre_revision_commit.send(
+            sender=create_revision,
+            revision=revision,
+            versions=versions,
+        )
+    # Save the revisions. Primary keys of bulk inserted rows are populated only on some databases.
+    if len(revisions) > 1 and connections[using].features.can_return_rows_from_bulk_insert:
+        Revision.objects.using(using).bulk_create(revisions)
+    else:
+        for revision in revisions:
+            revision.save(using=using)
+    all_versions = [version for versions in revision_versions for version in versions]
+    payloads = {version.payload_id: version.payload for version in all_versions if version.payload_id is not None}
+    with transaction.atomic(using=using):
+        # Save shared payloads of deduplicated versions. Existing payloads are locked until the versions are committed,
+        # so they cannot be deleted as unreferenced by a concurrent deleterevisions.
+        if payloads:
+            locked_hashes = set(VersionPayload.objects.using(using).select_for_update().filter(
+                pk__in=payloads.keys(),
+            ).order_by("pk").values_list("pk", flat=True))
+            VersionPayload.objects.using(using).bulk_create(
+                [payload for payload_hash, payload in payloads.items() if payload_hash not in locked_hashes],
+                ignore_conflicts=True,
+            )
+        # Save version models. Primary keys are populated only on databases that can return rows from a bulk insert.
+        for revision, versions in zip(revisions, revision_versions):
+            for version in versions:
+                version.revision = revision
+        Version.objects.using(using).bulk_create(
+            all_versions,
+            batch_size=get_config().bulk_create_batch_size,
+        )
+    for revision, versions in zip(revisions, revision_versions):
+        post_revision_commit.send(
+            sender=create_revision,
+            revision=revision,
+            versions=versions,
+            revision_id=revision.id
+        )
+    return [revision.pk for revision in revisions]
 
 
 def get_db_name():
@@ -410,3 +605,7 @@ def get_revision_or_none(id):
         return Revision.objects.get(pk=id)
     except ObjectDoesNotExist:
         return None
+
+
+def get_version_queryset(using=None):
+    return Version.objects.using(using)
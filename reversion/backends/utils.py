@@ -1,12 +1,26 @@
+import hashlib
+import json
+from collections import defaultdict
+
+import django
 from django.core import serializers
+from django.core.exceptions import ObjectDoesNotExist
 from django.core.serializers.base import DeserializationError
-from django.db import models
+from django.db import IntegrityError, connections, models, transaction
 from django.utils.encoding import force_str
 from django.utils.translation import ugettext
 
+from reversion.compression import compress, decompress
+from reversion.conf import get_config
 from reversion.errors import RevertError
 from reversion.revisions import _get_options
-from reversion.serializers import deserialize_instance, deserialize_raw_fields
+from reversion.serializers import deserialize_instance, deserialize_raw_fields, get_serializer, supports_delta
+
+
+DELTA_PREFIX = 'delta:'
+
+
+_MISSING = object()
 
 
 def get_object_version(model, data, object_repr, format):
@@ -25,13 +39,19 @@ def get_object_version(model, data, object_repr, format):
         })
 
 
-def get_local_field_dict(model, object_version):
+def get_local_field_dict(model, version):
     """
-    A dictionary mapping field names to field values in object version of the model.
+    A dictionary mapping field names to field values in the version of the model.
 
     Parent links of inherited multi-table models will not be followed.
     """
     version_options = _get_options(model)
+    if version_options.deserializer is not None and version.format == version_options.format:
+        # Decode the data directly, the model instance is built only if the fast path can't be used.
+        field_dict = version_options.deserializer(version._serialized_data)
+        if field_dict is not None:
+            return field_dict
+    object_version = version._object_version
     obj = object_version.object
     field_dict = {}
     for field_name in version_options.fields:
@@ -48,7 +68,7 @@ def get_local_field_dict(model, object_version):
 def get_raw_field_dict(data, object_repr, format):
     try:
         return deserialize_raw_fields(format, data)
-    except DeserializationError:
+    except (DeserializationError, ValueError, KeyError, IndexError):
         raise RevertError(ugettext('Could not load %(object_repr)s version - incompatible version data.') % {
             'object_repr': object_repr,
         })
@@ -57,3 +77,288 @@ def get_raw_field_dict(data, object_repr, format):
             'object_repr': object_repr,
             'format': format,
         })
+
+
+def get_delta_keyframe_key(data):
+    """
+    Returns the key of the keyframe of delta data, or ``None`` for full data.
+
+    Delta data are stored as ``delta:<keyframe key>:<delta>``, the keyframe key is defined by the backend.
+    """
+    if data and data.startswith(DELTA_PREFIX):
+        return data[len(DELTA_PREFIX):].split(':', 1)[0]
+    return None
+
+
+def _load_delta(data):
+    return json.loads(decompress(data.split(':', 2)[2]))
+
+
+def _apply_delta(format, delta, keyframe_data):
+    serializer = get_serializer(format)
+    keyframe_fields = serializer._deserialize_raw(keyframe_data)[0]['fields']
+    fields = {name: value for name, value in keyframe_fields.items() if name not in delta['removed']}
+    fields.update(delta['fields'])
+    return serializer._serialize_raw([{'model': delta['model'], 'pk': delta['pk'], 'fields': fields}])
+
+
+def get_serialized_data(version):
+    """
+    Returns the full serialized data of the version, decompressed and reconstructed from the keyframe of delta data.
+    """
+    try:
+        data = version._stored_data
+        if get_delta_keyframe_key(data) is None:
+            return decompress(data)
+        keyframe = version._keyframe
+        if keyframe is None:
+            raise DeserializationError('Missing keyframe of the delta version')
+        return _apply_delta(version.format, _load_delta(data), keyframe._serialized_data)
+    except (DeserializationError, ValueError, KeyError, IndexError):
+        raise RevertError(ugettext('Could not load %(object_repr)s version - incompatible version data.') % {
+            'object_repr': version.object_repr,
+        })
+    except serializers.SerializerDoesNotExist:
+        raise RevertError(ugettext('Could not load %(object_repr)s version - unknown serializer %(format)s.') % {
+            'object_repr': version.object_repr,
+            'format': version.format,
+        })
+
+
+def get_delta_data(version_options, data, previous_version):
+    """
+    Returns the delta data of a new object version against the keyframe of the previous version of the object and
+    the keyframe. ``(None, None)`` is returned if the new version has to be stored as a keyframe.
+
+    A keyframe is stored every ``delta`` versions of the object, so at most one keyframe is needed to reconstruct
+    a version.
+    """
+    if previous_version is None or previous_version.format != version_options.format:
+        return None, None
+    try:
+        if get_delta_keyframe_key(previous_version.serialized_data) is None:
+            keyframe, sequence = previous_version, 1
+        else:
+            keyframe = previous_version._keyframe
+            sequence = _load_delta(previous_version.serialized_data)['sequence'] + 1
+        if keyframe is None or sequence >= version_options.delta:
+            return None, None
+        serializer = get_serializer(version_options.format)
+        obj_data = serializer._deserialize_raw(data)[0]
+        keyframe_fields = serializer._deserialize_raw(keyframe._serialized_data)[0]['fields']
+    except (RevertError, DeserializationError, ValueError, KeyError, IndexError):
+        # Broken history is not repaired by a delta, the version is stored as a new keyframe.
+        return None, None
+    fields = obj_data['fields']
+    delta = {
+        'sequence': sequence,
+        'model': obj_data['model'],
+        'pk': obj_data['pk'],
+        'fields': {name: value for name, value in fields.items() if keyframe_fields.get(name, _MISSING) != value},
+        'removed': [name for name in keyframe_fields if name not in fields],
+    }
+    delta_data = compress(json.dumps(delta, ensure_ascii=False, separators=(',', ':')), version_options.compress)
+    return '{}{}:{}'.format(DELTA_PREFIX, keyframe._keyframe_key, delta_data), keyframe
+
+
+def get_payload_hash(data):
+    """Returns the hash of serialized data, deduplicated versions share the payload with the same hash."""
+    return hashlib.sha256(data.encode('utf8')).hexdigest()
+
+
+def _json_sort_key(value):
+    return json.dumps(value, sort_keys=True)
+
+
+def get_content_hash(version):
+    """
+    Returns the hash of the local field values of the version, the order of m2m values doesn't change the hash.
+
+    The hash is stored with the version when it is saved, it is computed from the data of versions saved without it.
+    ``None`` is returned if the raw field values can't be decoded from the format of the version.
+    """
+    if version.content_hash:
+        return version.content_hash
+    if not supports_delta(version.format):
+        return None
+    fields = dict(version._local_raw_field_dict)
+    for field in version._model._meta.concrete_model._meta.local_many_to_many:
+        if isinstance(fields.get(field.name), list):
+            fields[field.name] = sorted(fields[field.name], key=_json_sort_key)
+    version.content_hash = get_payload_hash(
+        json.dumps(fields, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    )
+    return version.content_hash
+
+
+def _safe_revert(versions):
+    unreverted_versions = []
+    for version in versions:
+        try:
+            with transaction.atomic(using=version.db):
+                version.revert()
+        except (IntegrityError, ObjectDoesNotExist):
+            unreverted_versions.append(version)
+    if len(unreverted_versions) == len(versions):
+        raise RevertError(ugettext('Could not save %(object_repr)s version - missing dependency.') % {
+            'object_repr': unreverted_versions[0],
+        })
+    if unreverted_versions:
+        _safe_revert(unreverted_versions)
+
+
+def _get_dependency_models(model):
+    """Returns the concrete models referenced by the foreign keys and m2m fields of the model."""
+    opts = model._meta.concrete_model._meta
+    return {
+        field.remote_field.model._meta.concrete_model
+        for field in tuple(opts.local_concrete_fields) + tuple(opts.local_many_to_many)
+        if field.is_relation and field.remote_field.model is not None
+    }
+
+
+def _get_revert_order(versions):
+    """
+    Returns the versions ordered so the models referenced by foreign keys are reverted before the models referencing
+    them, and the versions of models with cyclic dependencies, that have to be reverted by retrying.
+    """
+    model_versions = defaultdict(list)
+    for version in versions:
+        model_versions[version._model._meta.concrete_model].append(version)
+    # Only the models of the reverted versions are ordered, a model referencing itself is a cycle.
+    remaining_dependencies = {
+        model: _get_dependency_models(model) & model_versions.keys()
+        for model in model_versions
+    }
+    ordered_versions = []
+    while True:
+        ready_models = [
+            model for model, dependencies in remaining_dependencies.items()
+            if not dependencies & remaining_dependencies.keys()
+        ]
+        if not ready_models:
+            break
+        for model in ready_models:
+            ordered_versions.extend(model_versions[model])
+            del remaining_dependencies[model]
+    cyclic_versions = [version for model in remaining_dependencies for version in model_versions[model]]
+    return ordered_versions, cyclic_versions
+
+
+def _revert_versions(versions):
+    """
+    Reverts the versions in the order of the foreign keys of their models. Versions of models with cyclic
+    dependencies and versions failing in that order are retried by ``_safe_revert``.
+    """
+    ordered_versions, unreverted_versions = _get_revert_order(versions)
+    for version in ordered_versions:
+        try:
+            with transaction.atomic(using=version.db):
+                version.revert()
+        except (IntegrityError, ObjectDoesNotExist):
+            unreverted_versions.append(version)
+    if unreverted_versions:
+        _safe_revert(unreverted_versions)
+
+
+def _can_bulk_revert(model):
+    opts = model._meta.concrete_model._meta
+    # Inherited models are saved to several tables, symmetrical m2m relations store the reverse rows as well.
+    return not opts.parents and not any(
+        field.remote_field.symmetrical and field.remote_field.model == opts.concrete_model
+        for field in opts.local_many_to_many
+    )
+
+
+# Django versions with the checked signature of the private QuerySet._insert().
+RAW_INSERT_DJANGO_VERSIONS = ((2, 2), (3, 0), (3, 1), (3, 2))
+
+
+def _raw_bulk_insert(model, objs, using, batch_size):
+    """
+    Inserts the objects without ``pre_save()`` of the fields, like saved deserialized objects, so ``auto_now`` fields
+    keep the versioned values. ``bulk_create()`` has no raw mode, so the private ``QuerySet._insert()`` is used on
+    the Django versions it was checked with, other versions fall back to ``bulk_create()``.
+    """
+    manager = model._base_manager.using(using)
+    if django.VERSION[:2] not in RAW_INSERT_DJANGO_VERSIONS:
+        manager.bulk_create(objs, batch_size=batch_size)
+        return
+    fields = model._meta.local_concrete_fields
+    insert_batch_size = connections[using].ops.bulk_batch_size(fields, objs)
+    insert_batch_size = min(batch_size, insert_batch_size) if batch_size else insert_batch_size
+    for i in range(0, len(objs), insert_batch_size):
+        manager._insert(objs[i:i + insert_batch_size], fields, using=using, raw=True)
+    for obj in objs:
+        obj._state.adding = False
+        obj._state.db = using
+
+
+def _bulk_revert_model(model, versions, using):
+    batch_size = get_config().bulk_create_batch_size
+    object_versions = [version._object_version for version in versions]
+    objs = [object_version.object for object_version in object_versions]
+    manager = model._base_manager.using(using)
+    existing_pks = set(manager.filter(pk__in=[obj.pk for obj in objs]).values_list('pk', flat=True))
+    update_fields = [field.name for field in model._meta.concrete_fields if not field.primary_key]
+    if update_fields:
+        manager.bulk_update([obj for obj in objs if obj.pk in existing_pks], update_fields, batch_size=batch_size)
+    new_objs = [obj for obj in objs if obj.pk not in existing_pks]
+    if new_objs:
+        _raw_bulk_insert(model, new_objs, using, batch_size)
+    # Replace the rows of auto created m2m through tables.
+    for field in model._meta.local_many_to_many:
+        through = field.remote_field.through
+        obj_pks = [
+            (obj, object_version.m2m_data[field.name]) for obj, object_version in zip(objs, object_versions)
+            if through._meta.auto_created and object_version.m2m_data and field.name in object_version.m2m_data
+        ]
+        if not obj_pks:
+            continue
+        source_field = through._meta.get_field(field.m2m_field_name())
+        target_field = through._meta.get_field(field.m2m_reverse_field_name())
+        through_manager = through._base_manager.using(using)
+        through_manager.filter(**{
+            '{}__in'.format(source_field.name): [obj.pk for obj, _ in obj_pks],
+        }).delete()
+        through_manager.bulk_create([
+            through(**{source_field.attname: obj.pk, target_field.attname: pk})
+            for obj, pks in obj_pks
+            for pk in pks
+        ], batch_size=batch_size)
+
+
+def _bulk_revert(versions, using):
+    """
+    Reverts the versions with bulk queries per model. Model ``save()`` is not called and no model or m2m signals are
+    sent. Versions of inherited models and models with symmetrical m2m relations are reverted one by one.
+    """
+    ordered_versions, cyclic_versions = _get_revert_order(versions)
+    model_versions = defaultdict(list)
+    single_versions = []
+    for version in ordered_versions + cyclic_versions:
+        model = version._model._meta.concrete_model
+        if _can_bulk_revert(model):
+            model_versions[model].append(version)
+        else:
+            single_versions.append(version)
+    for model, versions in model_versions.items():
+        _bulk_revert_model(model, versions, using)
+    if single_versions:
+        _revert_versions(single_versions)
+
+
+def revert_versions(versions, bulk=False):
+    """
+    Reverts the versions in the order of the foreign keys of their models, the versions of every database are
+    reverted atomically. See ``Revision.revert()`` for the ``bulk`` mode.
+    """
+    versions_by_db = defaultdict(list)
+    for version in versions:
+        versions_by_db[version.db].append(version)
+    for version_db, db_versions in versions_by_db.items():
+        with transaction.atomic(using=version_db):
+            if bulk:
+                _bulk_revert(db_versions, version_db)
+            else:
+                _revert_versions(db_versions)
@@ -0,0 +1,59 @@
+import base64
+import zlib
+
+from django.core.serializers.base import DeserializationError
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+
+COMPRESSION_ZLIB = 'zlib'
+COMPRESSION_ZSTD = 'zstd'
+
+COMPRESSIONS = (COMPRESSION_ZLIB, COMPRESSION_ZSTD)
+
+
+def is_compression_available(compression):
+    return compression == COMPRESSION_ZLIB or (compression == COMPRESSION_ZSTD and zstandard is not None)
+
+
+def _compress_bytes(data, compression):
+    if compression == COMPRESSION_ZLIB:
+        return zlib.compress(data)
+    else:
+        return zstandard.ZstdCompressor().compress(data)
+
+
+def _decompress_bytes(data, compression):
+    if compression == COMPRESSION_ZLIB:
+        return zlib.decompress(data)
+    elif zstandard is None:
+        raise DeserializationError('zstandard library is required to decompress version data')
+    else:
+        return zstandard.ZstdDecompressor().decompress(data)
+
+
+def compress(data, compression):
+    """
+    Compresses the serialized data. The result is text with the compression tag as a prefix, e.g. ``zlib:<base64>``.
+    """
+    if not compression:
+        return data
+    return '{}:{}'.format(
+        compression, base64.b64encode(_compress_bytes(data.encode('utf8'), compression)).decode('ascii')
+    )
+
+
+def decompress(data):
+    """Decompresses the serialized data, data without a compression tag are returned unchanged."""
+    compression, separator, compressed_data = data.partition(':')
+    if not separator or compression not in COMPRESSIONS:
+        return data
+    try:
+        return _decompress_bytes(base64.b64decode(compressed_data), compression).decode('utf8')
+    except DeserializationError:
+        raise
+    except Exception as ex:
+        raise DeserializationError() from ex
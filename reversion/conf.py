@@ -0,0 +1,56 @@
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.signals import setting_changed
+
+
+_Config = namedtuple("Config", (
+    "enabled",
+    "backend",
+    "atomic",
+    "serializers",
+    "bulk_create_batch_size",
+    "async_commit",
+    "async_commit_workers",
+    "async_commit_queue_size",
+    "async_commit_full_policy",
+    "dynamodb_ttl",
+))
+
+
+_config = None
+
+
+def _load_config():
+    from reversion.serializers import SERIALIZERS
+
+    return _Config(
+        enabled=getattr(settings, 'REVERSION_ENABLED', True),
+        backend=getattr(settings, 'REVERSION_BACKEND', None),
+        atomic=getattr(settings, 'REVERSION_ATOMIC_REVISION', True),
+        serializers=tuple(getattr(settings, 'REVERSION_SERIALIZERS', SERIALIZERS)),
+        bulk_create_batch_size=getattr(settings, 'REVERSION_BULK_CREATE_BATCH_SIZE', None),
+        async_commit=getattr(settings, 'REVERSION_ASYNC_COMMIT', False),
+        async_commit_workers=getattr(settings, 'REVERSION_ASYNC_COMMIT_WORKERS', 1),
+        async_commit_queue_size=getattr(settings, 'REVERSION_ASYNC_COMMIT_QUEUE_SIZE', 1000),
+        async_commit_full_policy=getattr(settings, 'REVERSION_ASYNC_COMMIT_FULL_POLICY', 'block'),
+        dynamodb_ttl=getattr(settings, 'REVERSION_DYNAMODB_TTL', None),
+    )
+
+
+def get_config():
+    """Returns the reversion settings, resolved once and refreshed when a reversion setting changes."""
+    global _config
+    config = _config
+    if config is None:
+        config = _config = _load_config()
+    return config
+
+
+def _setting_changed_receiver(setting, **kwargs):
+    global _config
+    if setting.startswith('REVERSION_'):
+        _config = None
+
+
+setting_changed.connect(_setting_changed_receiver)
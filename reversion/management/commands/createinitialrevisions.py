@@ -0,0 +1,127 @@
+import json
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from functools import partial
+from multiprocessing import get_context
+
+from django.apps import apps
+from django.core.management import CommandError
+from django.db import connections, reset_queries, transaction
+from reversion.backends import get_backend
+from reversion.management.commands import BaseRevisionCommand
+from reversion.revisions import _dummy_context, _save_revisions
+
+
+def _map_bounded(executor, func, items, max_pending):
+    """
+    Like ``executor.map()``, but at most ``max_pending`` items are read ahead. Results are yielded as completed.
+    """
+    pending = set()
+    for item in items:
+        if len(pending) >= max_pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+        # Worker processes can be forked by any submit, they must not inherit open database connections.
+        connections.close_all()
+        pending.add(executor.submit(func, item))
+    for future in as_completed(pending):
+        yield future.result()
+
+
+def _create_initial_revisions(model_label, meta, comment, using, model_db, object_ids):
+    """Saves the initial revisions of a chunk of objects in one transaction, runs in the worker processes as well."""
+    model = apps.get_model(model_label)
+    meta = [(apps.get_model(label), values) for label, values in meta]
+    with transaction.atomic(using=using) if using else _dummy_context():
+        objs = list(model._default_manager.using(model_db).in_bulk(object_ids).values())
+        _save_revisions(objs, using, model_db=model_db, comment=comment, meta=meta)
+    reset_queries()
+    return len(objs)
+
+
+class Command(BaseRevisionCommand):
+
+    help = "Creates initial revisions for a given app [and model]."
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--comment",
+            action="store",
+            default="Initial version.",
+            help="Specify the comment to add to the revisions. Defaults to 'Initial version'.")
+        parser.add_argument(
+            "--batch-size",
+            action="store",
+            type=int,
+            default=500,
+            help="For large sets of data, revisions will be populated in batches. Defaults to 500.",
+        )
+        parser.add_argument(
+            "--workers",
+            action="store",
+            type=int,
+            default=1,
+            help=(
+                "Number of processes populating the batches. Defaults to 1. Unversioned objects are found in the main "
+                "process, the DynamoDB backend checks them with one index query per object."
+            ),
+        )
+        parser.add_argument(
+            "--meta",
+            action="store",
+            default={},
+            type=json.loads,
+            help=("Specify meta models and corresponding values for each initial revision as JSON"
+                  "eg. --meta \"{\"core.RevisionMeta\", {\"hello\": \"world\"}}\""),
+        )
+
+    def handle(self, *app_labels, **options):
+        verbosity = options["verbosity"]
+        using = options["using"]
+        model_db = options["model_db"]
+        comment = options["comment"]
+        batch_size = options["batch_size"]
+        workers = options["workers"]
+        meta = options["meta"]
+        for label in meta.keys():
+            try:
+                apps.get_model(label)
+            except LookupError:
+                raise CommandError("Unknown model: {}".format(label))
+        # Create revisions.
+        backend = get_backend()
+        using = using or backend.get_db_name()
+        for model in self.get_models(options):
+            # Check all models for empty revisions.
+            if verbosity >= 1:
+                self.stdout.write("Creating revisions for {name}".format(
+                    name=model._meta.verbose_name,
+                ))
+            created_count = 0
+            # Save all the versions, every batch is committed separately, so the command can be resumed.
+            chunks = backend.iter_unversioned_object_ids(model, model_db=model_db, using=using, batch_size=batch_size)
+            create_initial_revisions = partial(
+                _create_initial_revisions, model._meta.label, list(meta.items()), comment, using, model_db,
+            )
+            if workers > 1:
+                executor = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("fork"))
+                chunk_counts = _map_bounded(executor, create_initial_revisions, chunks, 2 * workers)
+            else:
+                executor = None
+                chunk_counts = map(create_initial_revisions, chunks)
+            try:
+                for chunk_count in chunk_counts:
+                    created_count += chunk_count
+                    if verbosity >= 2:
+                        self.stdout.write("- Created {created_count}".format(
+                            created_count=created_count,
+                        ))
+            finally:
+                if executor is not None:
+                    executor.shutdown()
+            # Print out a message, if feeling verbose.
+            if verbosity >= 1:
+                self.stdout.write("- Created {created_count} revisions".format(
+                    created_count=created_count,
+                ))
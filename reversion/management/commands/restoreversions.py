@@ -0,0 +1,75 @@
+from django.core.management import CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from reversion.management.commands import BaseRevisionCommand
+from reversion.restore import restore
+
+
+def _parse_date(value):
+    try:
+        date = parse_datetime(value)
+    except ValueError:
+        date = None
+    if date is None:
+        raise CommandError("Invalid date: {}".format(value))
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+class Command(BaseRevisionCommand):
+
+    help = "Restores objects of a given app [and model] to their versions at a given date."
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--date",
+            required=True,
+            help="Restore the latest versions created at or before the date, e.g. '2020-01-31 12:00'.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            action="store",
+            type=int,
+            default=500,
+            help="Versions are reverted in batches, every batch in a transaction. Defaults to 500.",
+        )
+        parser.add_argument(
+            "--bulk",
+            action="store_true",
+            default=False,
+            help="Revert the versions with bulk queries. Model save() is not called and no signals are sent.",
+        )
+
+    def handle(self, *app_labels, **options):
+        verbosity = options["verbosity"]
+        using = options["using"]
+        model_db = options["model_db"]
+        date = _parse_date(options["date"])
+        for model in self.get_models(options):
+            if verbosity >= 1:
+                self.stdout.write("Restoring {name}".format(
+                    name=model._meta.verbose_name,
+                ))
+
+            def progress(restored_count):
+                if verbosity >= 2:
+                    self.stdout.write("- Restored {restored_count}".format(
+                        restored_count=restored_count,
+                    ))
+
+            restored_count = restore(
+                model,
+                date,
+                model_db=model_db,
+                using=using,
+                batch_size=options["batch_size"],
+                bulk=options["bulk"],
+                progress=progress,
+            )
+            # Print out a message, if feeling verbose.
+            if verbosity >= 1:
+                self.stdout.write("- Restored {restored_count} objects".format(
+                    restored_count=restored_count,
+                ))
@@ -1,5 +1,4 @@
-from django.conf import settings
-
+from reversion.conf import get_config
 from reversion.revisions import create_revision, set_user, set_comment, deactivate
 
 
@@ -13,7 +12,7 @@ class RevisionMiddleware:
 
     def __init__(self, get_response):
         self.get_response = get_response
-        self.atomic = getattr(settings, 'REVERSION_ATOMIC_REVISION', True)
+        self.atomic = get_config().atomic
 
     def __call__(self, request):
         with create_revision(manage_manually=self.manage_manually, using=self.using, atomic=self.atomic,
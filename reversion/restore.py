@@ -0,0 +1,27 @@
+from itertools import islice
+
+from django.db import router
+
+from reversion.backends import get_backend
+from reversion.backends.utils import revert_versions
+
+
+def restore(model, date, model_db=None, using=None, batch_size=500, bulk=False, progress=None):
+    """
+    Reverts every object of the model to its latest version created at or before the date and returns the number of
+    reverted objects.
+
+    Versions are streamed from the backend and reverted in atomic batches, ``progress`` is called with the number of
+    objects reverted so far after every batch. Objects created after the date are left untouched.
+    """
+    model_db = model_db or router.db_for_write(model)
+    versions = get_backend().iter_versions_at(model, date, model_db=model_db, using=using)
+    count = 0
+    while True:
+        batch = list(islice(versions, batch_size))
+        if not batch:
+            return count
+        revert_versions(batch, bulk=bulk)
+        count += len(batch)
+        if progress is not None:
+            progress(count)
@@ -1,16 +1,19 @@
 from collections import namedtuple, defaultdict
 from contextlib import contextmanager
-from functools import wraps
+from functools import partial, wraps
 from threading import local
 from django.apps import apps
 from django.core.exceptions import ObjectDoesNotExist
-from django.conf import settings
 from django.db import models, transaction, router
+from django.db.models.fields.related_descriptors import ReverseManyToOneDescriptor
 from django.db.models.query import QuerySet
-from django.db.models.signals import post_save, m2m_changed, post_delete
+from django.db.models.signals import post_save, m2m_changed, post_delete, post_migrate
 from django.utils.encoding import force_str
 from django.utils import timezone
-from reversion.errors import RevisionManagementError, RegistrationError
+from reversion.compression import is_compression_available
+from reversion.conf import get_config
+from reversion.errors import RevisionManagementError, RegistrationError, RevertError
+from reversion.serializers import compile_instance_serializer, compile_field_dict_deserializer, supports_delta
 from reversion.signals import pre_revision_commit, post_revision_commit
 
 
@@ -27,6 +30,11 @@ _VersionOptions = namedtuple("VersionOptions", (
     "for_concrete_model",
     "ignore_duplicates",
     "use_natural_foreign_keys",
+    "serializer",
+    "deserializer",
+    "compress",
+    "delta",
+    "deduplicate",
 ))
 
 
@@ -36,6 +44,9 @@ _StackFrame = namedtuple("StackFrame", (
     "comment",
     "date_created",
     "db_versions",
+    "db_saved_version_keys",
+    "db_transaction_states",
+    "db_version_origins",
     "meta",
 ))
 
@@ -64,22 +75,24 @@ def _current_frame():
     return _local.stack[-1]
 
 
-def _copy_db_versions(db_versions):
-    return {
-        db: versions.copy()
-        for db, versions
-        in db_versions.items()
-    }
-
-
 def _push_frame(manage_manually, using):
     if is_active():
         current_frame = _current_frame()
-        db_versions = _copy_db_versions(current_frame.db_versions)
+        # Nested frames share the versions of the databases they have in common with the enclosing frame.
+        db_versions = dict(current_frame.db_versions)
         db_versions.setdefault(using, {})
+        db_saved_version_keys = dict(current_frame.db_saved_version_keys)
+        db_saved_version_keys.setdefault(using, {})
+        db_transaction_states = dict(current_frame.db_transaction_states)
+        db_transaction_states.setdefault(using, _get_transaction_state(using))
+        db_version_origins = dict(current_frame.db_version_origins)
+        db_version_origins.setdefault(using, defaultdict(set))
         stack_frame = current_frame._replace(
             manage_manually=manage_manually,
             db_versions=db_versions,
+            db_saved_version_keys=db_saved_version_keys,
+            db_transaction_states=db_transaction_states,
+            db_version_origins=db_version_origins,
         )
     else:
         stack_frame = _StackFrame(
@@ -88,6 +101,9 @@ def _push_frame(manage_manually, using):
             comment="",
             date_created=timezone.now(),
             db_versions={using: {}},
+            db_saved_version_keys={using: {}},
+            db_transaction_states={using: _get_transaction_state(using)},
+            db_version_origins={using: defaultdict(set)},
             meta=(),
         )
     _local.stack += (stack_frame,)
@@ -101,66 +117,60 @@ def _pop_frame():
     prev_frame = _current_frame()
     _local.stack = _local.stack[:-1]
     if is_active():
-        current_frame = _current_frame()
-        db_versions = {
-            db: prev_frame.db_versions[db]
-            for db
-            in current_frame.db_versions.keys()
-        }
+        # Versions are shared with the enclosing frame, so only the revision metadata has to be passed back.
         _update_frame(
             user=prev_frame.user,
             comment=prev_frame.comment,
             date_created=prev_frame.date_created,
-            db_versions=db_versions,
             meta=prev_frame.meta,
         )
 
 
 def is_manage_manually():
-    if getattr(settings, 'REVERSION_ENABLED', True):
+    if get_config().enabled:
         return _current_frame().manage_manually
     else:
         return False
 
 
 def set_user(user):
-    if getattr(settings, 'REVERSION_ENABLED', True):
+    if get_config().enabled:
         _update_frame(user=user)
 
 
 def get_user():
-    if getattr(settings, 'REVERSION_ENABLED', True):
+    if get_config().enabled:
         return _current_frame().user
     else:
         return None
 
 
 def set_comment(comment):
-    if getattr(settings, 'REVERSION_ENABLED', True):
+    if get_config().enabled:
         _update_frame(comment=comment)
 
 
 def get_comment():
-    if getattr(settings, 'REVERSION_ENABLED', True):
+    if get_config().enabled:
         return _current_frame().comment
     else:
         return None
 
 
 def set_date_created(date_created):
-    if getattr(settings, 'REVERSION_ENABLED', True):
+    if get_config().enabled:
         _update_frame(date_created=date_created)
 
 
 def get_date_created():
-    if getattr(settings, 'REVERSION_ENABLED', True):
+    if get_config().enabled:
         return _current_frame().date_created
     else:
         return None
 
 
 def add_meta(model, **values):
-    if getattr(settings, 'REVERSION_ENABLED', True):
+    if get_config().enabled:
         _update_frame(meta=_current_frame().meta + ((model, values),))
 
 
@@ -183,62 +193,188 @@ def _follow_relations(obj):
             ))
 
 
-def _follow_relations_recursive(obj):
-    def do_follow(obj):
-        if obj not in relations:
-            relations.add(obj)
-            for related in _follow_relations(obj):
-                do_follow(related)
+def _follow_relations_recursive(objs):
+    """Returns the objects with all objects followed from them, the relations are prefetched level by level."""
     relations = set()
-    do_follow(obj)
+    level = objs
+    while level:
+        new_objs = []
+        for obj in level:
+            if obj not in relations:
+                relations.add(obj)
+                new_objs.append(obj)
+        level = []
+        with _prefetch_follow_relations(new_objs):
+            for obj in new_objs:
+                level.extend(_follow_relations(obj))
     return relations
 
 
-def _add_to_revision(obj, using, model_db, explicit, is_delete):
-    from reversion.models import prepare_version_object
+def _is_prefetchable(model, follow_name):
+    # Related object descriptors prefetch themselves, related managers (including m2m) are created by the descriptor.
+    descriptor = getattr(model, follow_name, None)
+    return isinstance(descriptor, ReverseManyToOneDescriptor) or hasattr(descriptor, "get_prefetch_queryset")
+
+
+@contextmanager
+def _prefetch_follow_relations(objs):
+    """
+    Prefetches the followed relations of the objects with one query per model and relation. The prefetched related
+    managers are removed from the objects on exit, the objects may belong to the caller.
+    """
+    model_objs = defaultdict(list)
+    prefetched_names = []
+    for obj in objs:
+        model_objs[obj.__class__].append(obj)
+        prefetched_names.append((obj, set(getattr(obj, "_prefetched_objects_cache", ()))))
+    for model, objs in model_objs.items():
+        follow_names = [
+            follow_name for follow_name in _get_options(model).follow if _is_prefetchable(model, follow_name)
+        ]
+        if follow_names:
+            models.prefetch_related_objects(objs, *follow_names)
+    try:
+        yield
+    finally:
+        for obj, names in prefetched_names:
+            prefetched_objects_cache = getattr(obj, "_prefetched_objects_cache", {})
+            for name in set(prefetched_objects_cache) - names:
+                del prefetched_objects_cache[name]
+
+
+def _add_version(obj, using, model_db, explicit, is_delete, is_saved=False, follow_origin=None):
+    """Adds the object to the revision, returns the version key if the relations of the object should be followed."""
+    from reversion.backends import get_backend
     # Exit early if the object is not fully-formed.
     if obj.pk is None:
-        return
+        return None
     version_options = _get_options(obj.__class__)
     content_type = _get_content_type(obj.__class__, using)
     object_id = force_str(obj.pk)
     version_key = (content_type, object_id)
+    current_frame = _current_frame()
+    # Objects saved in the revision block are known to exist, deleted objects have to be checked again. The
+    # transaction state of the save is kept, the save is rolled back with a savepoint rolled back later.
+    if is_saved:
+        current_frame.db_saved_version_keys[using][version_key] = (model_db, _get_transaction_state(model_db))
+    elif is_delete:
+        current_frame.db_saved_version_keys[using].pop(version_key, None)
+    # Remember why the object was added, versions followed only from skipped duplicates are skipped too.
+    current_frame.db_version_origins[using][version_key].add(follow_origin)
     # If the obj is already in the revision, stop now.
-    db_versions = _current_frame().db_versions
-    versions = db_versions[using]
+    versions = current_frame.db_versions[using]
     if version_key in versions and not explicit:
-        return
+        return None
 
-    version = prepare_version_object(
+    version = get_backend().prepare_version_object(
         obj, content_type, object_id, model_db, version_options, explicit, using, is_delete
     )
 
-    # If the version is a duplicate, stop now.
+    # Deleted objects have no version.
     if not version:
-        return
+        return None
 
+    # Duplicates are checked with one batched query on commit.
+    version._version_options = version_options
+    version._ignore_duplicates = version_options.ignore_duplicates and explicit and not is_delete
     # Store the version.
-    db_versions = _copy_db_versions(db_versions)
-    db_versions[using][version_key] = version
-    _update_frame(db_versions=db_versions)
-    # Follow relations.
-    for follow_obj in _follow_relations(obj):
-        _add_to_revision(follow_obj, using, model_db, False, is_delete)
+    versions[version_key] = version
+    return version_key
 
 
-def add_to_revision(obj, model_db=None, is_delete=False):
+def _add_to_revision(obj, using, model_db, explicit, is_delete, is_saved=False):
+    version_key = _add_version(obj, using, model_db, explicit, is_delete, is_saved)
+    if version_key is None:
+        return
+    # Follow relations breadth-first, objects already in the revision are not followed again.
+    level = [(obj, version_key)]
+    while level:
+        next_level = []
+        with _prefetch_follow_relations([level_obj for level_obj, _ in level]):
+            for level_obj, level_version_key in level:
+                for follow_obj in _follow_relations(level_obj):
+                    follow_version_key = _add_version(
+                        follow_obj, using, model_db, False, is_delete, follow_origin=level_version_key,
+                    )
+                    if follow_version_key is not None:
+                        next_level.append((follow_obj, follow_version_key))
+        level = next_level
+
+
+def _add_to_current_revision(obj, model_db, is_delete, is_saved):
     model_db = model_db or router.db_for_write(obj.__class__, instance=obj)
     for db in _current_frame().db_versions.keys():
-        _add_to_revision(obj, db, model_db, True, is_delete)
+        _add_to_revision(obj, db, model_db, True, is_delete, is_saved)
+
+
+def add_to_revision(obj, model_db=None, is_delete=False):
+    _add_to_current_revision(obj, model_db, is_delete, False)
 
 
-def _save_revision(versions, user=None, comment="", meta=(), date_created=None, using=None):
-    from reversion.models import save_revision
-    # Only save versions that exist in the database.
+def _is_duplicate_version(version, previous_version):
+    from reversion.backends.utils import get_content_hash
+    if previous_version is None or previous_version.is_delete:
+        return False
+    try:
+        content_hash = get_content_hash(version)
+        if content_hash is not None:
+            return content_hash == get_content_hash(previous_version)
+        return version._local_field_dict == previous_version._local_field_dict
+    except RevertError:
+        return False
+
+
+def _skip_duplicate_versions(versions, version_origins, using):
+    """
+    Loads the latest saved versions of the objects with one batched query and skips duplicate versions with the
+    versions followed only from them. The latest versions are kept in ``_previous_version`` for delta storage.
+    """
+    from reversion.backends import get_backend
+    lookup_keys = [
+        version_key for version_key, version in versions.items()
+        if version._ignore_duplicates or version._version_options.delta
+    ]
+    if not lookup_keys:
+        return versions
+    previous_versions = get_backend().get_latest_versions([versions[key] for key in lookup_keys], using)
+    duplicate_keys = set()
+    for version_key, previous_version in zip(lookup_keys, previous_versions):
+        version = versions[version_key]
+        version._previous_version = previous_version
+        if version._ignore_duplicates and _is_duplicate_version(version, previous_version):
+            duplicate_keys.add(version_key)
+    if not duplicate_keys:
+        return versions
+    # Keep explicitly added versions, that are not duplicates, and the versions followed from them.
+    followed_keys = defaultdict(list)
+    kept_keys = set()
+    for version_key in versions:
+        for origin in version_origins.get(version_key, (None,)):
+            if origin is None:
+                if version_key not in duplicate_keys:
+                    kept_keys.add(version_key)
+            else:
+                followed_keys[origin].append(version_key)
+                if origin not in versions:
+                    kept_keys.add(origin)
+    stack = list(kept_keys)
+    while stack:
+        for version_key in followed_keys[stack.pop()]:
+            if version_key not in kept_keys:
+                kept_keys.add(version_key)
+                stack.append(version_key)
+    return {version_key: version for version_key, version in versions.items() if version_key in kept_keys}
+
+
+def _save_revision(versions, user=None, comment="", meta=(), date_created=None, using=None,
+                   saved_version_keys=frozenset(), version_origins=None):
+    from reversion.backends import get_backend
+    # Only save versions that exist in the database. Objects saved in the revision block are known to exist.
     # Use _base_manager so we don't have problems when _default_manager is overriden
     model_db_pks = defaultdict(lambda: defaultdict(set))
-    for version in versions:
-        model_db_pks[version._model][version.db].add(version.object_id)
+    for version_key, version in versions.items():
+        if not version.is_delete and version_key not in saved_version_keys:
+            model_db_pks[version._model][version.db].add(version.object_id)
     model_db_existing_pks = {
         model: {
             db: frozenset(map(
@@ -249,16 +385,20 @@ def _save_revision(versions, user=None, comment="", meta=(), date_created=None,
         }
         for model, db_pks in model_db_pks.items()
     }
-    versions = [
-        version for version in versions
-        if version.is_delete or version.object_id in model_db_existing_pks[version._model][version.db]
-    ]
+    versions = {
+        version_key: version for version_key, version in versions.items()
+        if (
+            version.is_delete or version_key in saved_version_keys or
+            version.object_id in model_db_existing_pks[version._model][version.db]
+        )
+    }
+    versions = list(_skip_duplicate_versions(versions, version_origins or {}, using).values())
     # Bail early if there are no objects to save.
     if not versions:
         return
 
     # Save a new revision.
-    revision_id = save_revision(date_created, user, comment, versions, using)
+    revision_id = get_backend().save_revision(date_created, user, comment, versions, using)
 
     # Save the meta information.
     for meta_model, meta_fields in meta:
@@ -268,14 +408,81 @@ def _save_revision(versions, user=None, comment="", meta=(), date_created=None,
         )
 
 
+def _save_revisions(objs, using, model_db=None, user=None, comment="", meta=()):
+    """
+    Saves a revision for every object with one backend call and returns the revision ids. The objects must exist
+    and they must not be versioned yet, duplicate versions are not checked.
+    """
+    from reversion.backends import get_backend
+    revision_versions = []
+    # The relations of all the objects are prefetched at once.
+    with _prefetch_follow_relations(objs):
+        for obj in objs:
+            _push_frame(False, using)
+            try:
+                obj_model_db = model_db or router.db_for_write(obj.__class__, instance=obj)
+                _add_to_revision(obj, using, obj_model_db, True, False, is_saved=True)
+                revision_versions.append(list(_current_frame().db_versions[using].values()))
+            finally:
+                _pop_frame()
+    if not revision_versions:
+        return []
+    revision_ids = get_backend().save_revisions(timezone.now(), user, comment, revision_versions, using)
+    # Save the meta information.
+    for meta_model, meta_fields in meta:
+        meta_model._base_manager.db_manager(using=using).bulk_create([
+            meta_model(revision_id=revision_id, **meta_fields)
+            for revision_id in revision_ids
+        ])
+    return revision_ids
+
+
+def _get_transaction_state(db):
+    connection = transaction.get_connection(db)
+    return connection.in_atomic_block, tuple(connection.savepoint_ids)
+
+
+def _get_saved_version_keys(frame, using):
+    """
+    Returns the keys of the objects saved in the revision block which are known to exist. Only saves at the
+    transaction depth of the revision are trusted, that depth is still live when the revision is committed.
+    """
+    transaction_state = frame.db_transaction_states[using]
+    if _get_transaction_state(using) != transaction_state:
+        return frozenset()
+    return frozenset(
+        version_key
+        for version_key, (model_db, save_transaction_state) in frame.db_saved_version_keys[using].items()
+        if model_db == using and save_transaction_state == transaction_state
+    )
+
+
 @contextmanager
 def _dummy_context():
     yield
 
 
+def _save_revision_atomic(atomic, **kwargs):
+    using = kwargs["using"]
+    with transaction.atomic(using=using) if atomic and using else _dummy_context():
+        _save_revision(**kwargs)
+
+
+def _commit_revision(atomic, **kwargs):
+    if get_config().async_commit:
+        from reversion.writer import get_writer
+        # The writer must not see the revision before the objects of the revision are committed.
+        transaction.on_commit(
+            partial(get_writer().submit, _save_revision_atomic, atomic, **kwargs),
+            using=kwargs["using"],
+        )
+    else:
+        _save_revision(**kwargs)
+
+
 @contextmanager
 def _create_revision_context(manage_manually, using, atomic, middleware):
-    if getattr(settings, 'REVERSION_ENABLED', True):
+    if get_config().enabled:
         context = transaction.atomic(using=using) if atomic and using else _dummy_context()
         with context:
             _push_frame(manage_manually, using)
@@ -285,13 +492,16 @@ def _create_revision_context(manage_manually, using, atomic, middleware):
                     # Only save for a db if that's the last stack frame for that db.
                     if not any(using in frame.db_versions for frame in _local.stack[:-1]):
                         current_frame = _current_frame()
-                        _save_revision(
-                            versions=current_frame.db_versions[using].values(),
+                        _commit_revision(
+                            atomic,
+                            versions=dict(current_frame.db_versions[using]),
                             user=current_frame.user,
                             comment=current_frame.comment,
                             meta=current_frame.meta,
                             date_created=current_frame.date_created,
                             using=using,
+                            saved_version_keys=_get_saved_version_keys(current_frame, using),
+                            version_origins=dict(current_frame.db_version_origins[using]),
                         )
                 finally:
                     _pop_frame()
@@ -303,9 +513,11 @@ def _create_revision_context(manage_manually, using, atomic, middleware):
 
 
 def create_revision(manage_manually=False, using=None, atomic=True, middleware=False):
-    from reversion.models import get_db_name
+    from reversion.backends import get_backend
 
-    return _ContextWrapper(_create_revision_context, (manage_manually, using or get_db_name(), atomic, middleware))
+    return _ContextWrapper(
+        _create_revision_context, (manage_manually, using or get_backend().get_db_name(), atomic, middleware)
+    )
 
 
 class _ContextWrapper(object):
@@ -331,18 +543,18 @@ class _ContextWrapper(object):
 
 def _post_save_receiver(sender, instance, using, **kwargs):
     if is_registered(sender) and is_active() and not is_manage_manually():
-        add_to_revision(instance, model_db=using)
+        _add_to_current_revision(instance, using, False, True)
 
 
 def _post_delete_receiver(sender, instance, using, **kwargs):
     if is_registered(sender) and is_active() and not is_manage_manually():
-        add_to_revision(instance, model_db=using, is_delete=True)
+        _add_to_current_revision(instance, using, True, False)
 
 
 def _m2m_changed_receiver(instance, using, action, model, reverse, **kwargs):
     if action.startswith("post_") and not reverse:
         if is_registered(instance) and is_active() and not is_manage_manually():
-            add_to_revision(instance, model_db=using)
+            _add_to_current_revision(instance, using, False, True)
 
 
 def _get_registration_key(model):
@@ -376,31 +588,51 @@ def _get_senders_and_signals(model):
 
 
 def register(model=None, fields=None, exclude=(), follow=(), format="json",
-             for_concrete_model=True, ignore_duplicates=False, use_natural_foreign_keys=False):
+             for_concrete_model=True, ignore_duplicates=False, use_natural_foreign_keys=False, compress=None,
+             delta=None, deduplicate=False):
     def register(model):
         # Prevent multiple registration.
         if is_registered(model):
             raise RegistrationError("{model} has already been registered with django-reversion".format(
                 model=model,
             ))
+        if compress and not is_compression_available(compress):
+            raise RegistrationError("Compression {compress} of {model} is not available".format(
+                compress=compress,
+                model=model,
+            ))
+        if delta and not supports_delta(format):
+            raise RegistrationError("Format {format} of {model} does not support delta storage".format(
+                format=format,
+                model=model,
+            ))
         # Parse fields.
         opts = model._meta.concrete_model._meta
+        version_fields = tuple(
+            field_name
+            for field_name
+            in ([
+                field.name
+                for field
+                in opts.local_fields + opts.local_many_to_many
+            ] if fields is None else fields)
+            if field_name not in exclude
+        )
         version_options = _VersionOptions(
-            fields=tuple(
-                field_name
-                for field_name
-                in ([
-                    field.name
-                    for field
-                    in opts.local_fields + opts.local_many_to_many
-                ] if fields is None else fields)
-                if field_name not in exclude
-            ),
+            fields=version_fields,
             follow=tuple(follow),
             format=format,
             for_concrete_model=for_concrete_model,
             ignore_duplicates=ignore_duplicates,
             use_natural_foreign_keys=use_natural_foreign_keys,
+            # Serializers are compiled once per registered model, unregister drops them with the options.
+            serializer=compile_instance_serializer(
+                format, model, fields=version_fields, use_natural_foreign_keys=use_natural_foreign_keys,
+            ),
+            deserializer=compile_field_dict_deserializer(format, model, fields=version_fields),
+            compress=compress,
+            delta=delta,
+            deduplicate=deduplicate,
         )
         # Register the model.
         _registered_models[_get_registration_key(model)] = version_options
@@ -430,16 +662,36 @@ def _get_options(model):
 
 def unregister(model):
     _assert_registered(model)
-    del _registered_models[_get_registration_key(model)]
+    registration_key = _get_registration_key(model)
+    del _registered_models[registration_key]
+    # Forget the content types resolved with the options of the model.
+    for content_type_key in list(_content_types):
+        if _get_registration_key(content_type_key[0]) == registration_key:
+            _content_types.pop(content_type_key, None)
     # Disconnect signals.
     for sender, signal, signal_receiver in _get_senders_and_signals(model):
         signal.disconnect(signal_receiver, sender=sender)
 
 
+_content_types = {}
+
+
 def _get_content_type(model, using):
-    from django.contrib.contenttypes.models import ContentType
-    version_options = _get_options(model)
-    return ContentType.objects.db_manager(using).get_for_model(
-        model,
-        for_concrete_model=version_options.for_concrete_model,
-    )
+    # Content types are resolved once per model and database, they are cleared on unregister and after migrations.
+    content_type_key = (model, using)
+    content_type = _content_types.get(content_type_key)
+    if content_type is None:
+        from django.contrib.contenttypes.models import ContentType
+        version_options = _get_options(model)
+        content_type = _content_types[content_type_key] = ContentType.objects.db_manager(using).get_for_model(
+            model,
+            for_concrete_model=version_options.for_concrete_model,
+        )
+    return content_type
+
+
+def _post_migrate_receiver(**kwargs):
+    _content_types.clear()
+
+
+post_migrate.connect(_post_migrate_receiver)
@@ -1,36 +1,76 @@
+from functools import partial
+
 import import_string
 
-from django.core.exceptions import ImproperlyConfigured
+from django.apps import apps
+from django.core.exceptions import ImproperlyConfigured, FieldDoesNotExist
 from django.core.serializers.base import SerializerDoesNotExist
 from django.core import serializers
+from django.db.models.query_utils import DeferredAttribute
+
+from reversion.conf import get_config
 
 
 SERIALIZERS = (
     'reversion.serializers.json.JsonSerializer',
+    'reversion.serializers.fastjson.FastJsonSerializer',
 )
 
 
 _serializers = {}
+_serializers_config = None
 
 
-def get_serializer_formats():
-    if not _serializers:
+def _get_serializers():
+    if _serializers_config is not get_config():
         _load_serializers()
-    return list(_serializers)
+    return _serializers
+
+
+def get_serializer_formats():
+    return list(_get_serializers())
 
 
 def get_serializer(format):
-    if not _serializers:
-        _load_serializers()
-    if format not in _serializers:
+    serializers = _get_serializers()
+    if format not in serializers:
         raise SerializerDoesNotExist(format)
-    return _serializers[format]
+    return serializers[format]
 
 
 def serialize_instance(format, instance, **options):
     return get_serializer(format).serialize_instance(instance, **options)
 
 
+def _serialize_instance_with_django(format, instance, **options):
+    return serializers.serialize(format, (instance,), **options)
+
+
+def compile_instance_serializer(format, model, **options):
+    """
+    Returns a callable that serializes an instance of the model.
+
+    Formats unknown to reversion are serialized with the Django serializer of the same name.
+    """
+    if format in _get_serializers():
+        return get_serializer(format).compile_instance_serializer(model, **options)
+    return partial(_serialize_instance_with_django, format, **options)
+
+
+def compile_field_dict_deserializer(format, model, **options):
+    """
+    Returns a callable that decodes serialized data of the model to a field dict, or ``None`` if the format is
+    unknown to reversion.
+    """
+    if format in _get_serializers():
+        return get_serializer(format).compile_field_dict_deserializer(model, **options)
+    return None
+
+
+def supports_delta(format):
+    return format in _get_serializers() and get_serializer(format).supports_delta
+
+
 def deserialize_instance(format, data, **options):
     return get_serializer(format).deserialize_instance(data, **options)
 
@@ -40,26 +80,149 @@ def deserialize_raw_fields(format, data, **options):
 
 
 def _load_serializers():
-    for serializer_class_str in SERIALIZERS:
+    global _serializers, _serializers_config
+    config = get_config()
+    serializers = {}
+    for serializer_class_str in config.serializers:
         try:
             serializer_class = import_string(serializer_class_str)
-            _serializers[serializer_class.format] = serializer_class()
+            serializers[serializer_class.format] = serializer_class()
         except ImportError:
             raise ImproperlyConfigured(f'Missing reversion serializer with on path {serializer_class_str}')
+    _serializers, _serializers_config = serializers, config
 
 
 class BaseSerializer:
 
     format = None
+    # Delta storage needs the raw data to be both decoded and encoded.
+    supports_delta = False
 
     def serialize_instance(self, instance, **options):
         return serializers.serialize(self.format, (instance,), **options)
 
+    def compile_instance_serializer(self, model, **options):
+        return partial(self.serialize_instance, **options)
+
+    def compile_field_dict_deserializer(self, model, **options):
+        return FieldDictDeserializer(self, model, **options)
+
     def deserialize_instance(self, data, **options):
         return list(serializers.deserialize(self.format, data, ignorenonexistent=True, **options))[0]
 
     def _deserialize_raw(self, data):
         raise NotImplementedError
 
+    def _serialize_raw(self, objects):
+        raise NotImplementedError
+
     def deserialize_raw_fields(self, data):
         return self._deserialize_raw(data)[0]['fields']
+
+
+_PK_VALUE = 'pk'
+_FK_VALUE = 'fk'
+_M2M_VALUE = 'm2m'
+_FIELD_VALUE = 'field'
+
+
+def _is_natural_key(value):
+    return hasattr(value, '__iter__') and not isinstance(value, str)
+
+
+class FieldDictDeserializer:
+
+    """
+    Decodes serialized data of one model directly to a field dict, without building the model instance.
+
+    Values are converted with the same ``to_python`` calls as the Django python deserializer. The decoder returns
+    ``None`` for data it cannot decode the same way, e.g. natural keys or invalid values, the caller must use the
+    Django deserializer then.
+    """
+
+    def __init__(self, serializer, model, fields=()):
+        self.serializer = serializer
+        self.model = model
+        self.fields = fields
+        self._converters = None
+        self._labels = {}
+
+    def _get_converter(self, field):
+        if field.primary_key:
+            return _PK_VALUE, field.attname, field, field.to_python
+        elif field.many_to_many:
+            return _M2M_VALUE, field.attname, field, field.remote_field.model._meta.pk.to_python
+        elif field.many_to_one or field.one_to_one:
+            target_field = field.remote_field.model._meta.get_field(field.remote_field.field_name)
+            return _FK_VALUE, field.attname, field, target_field.to_python
+        else:
+            return _FIELD_VALUE, field.attname, field, field.to_python
+
+    def _get_converters(self):
+        opts = self.model._meta.concrete_model._meta
+        converters = []
+        for field_name in self.fields:
+            try:
+                field = opts.get_field(field_name)
+            except FieldDoesNotExist:
+                return ()
+            if field not in opts.local_fields and field not in opts.local_many_to_many:
+                return ()
+            if not field.many_to_many and not issubclass(field.descriptor_class, DeferredAttribute):
+                # Custom descriptors (e.g. files) wrap the value, only a model instance returns it.
+                return ()
+            converters.append(self._get_converter(field))
+        return tuple(converters)
+
+    def _is_model_label(self, label):
+        if label not in self._labels:
+            try:
+                model = apps.get_model(label)
+            except (LookupError, ValueError):
+                model = None
+            self._labels[label] = (
+                model is not None and model._meta.concrete_model is self.model._meta.concrete_model
+            )
+        return self._labels[label]
+
+    def _decode(self, converters, data):
+        objects = self.serializer._deserialize_raw(data)
+        if len(objects) != 1:
+            return None
+        obj_data = objects[0]
+        if not self._is_model_label(obj_data['model']) or obj_data.get('pk') is None:
+            return None
+        raw_fields = obj_data['fields']
+        field_dict = {}
+        for value_type, attname, field, to_python in converters:
+            if value_type == _PK_VALUE:
+                field_dict[attname] = to_python(obj_data['pk'])
+            elif field.name not in raw_fields:
+                # Missing values get the default, the same as in the model constructor.
+                if value_type != _M2M_VALUE:
+                    field_dict[attname] = field.get_default()
+            elif value_type == _M2M_VALUE:
+                values = raw_fields[field.name]
+                if any(_is_natural_key(value) for value in values):
+                    return None
+                field_dict[attname] = [to_python(value) for value in values]
+            elif value_type == _FK_VALUE:
+                value = raw_fields[field.name]
+                if _is_natural_key(value):
+                    return None
+                field_dict[attname] = None if value is None else to_python(value)
+            else:
+                field_dict[attname] = to_python(raw_fields[field.name])
+        return field_dict
+
+    def __call__(self, data):
+        converters = self._converters
+        if converters is None:
+            converters = self._converters = self._get_converters()
+        if not converters:
+            return None
+        try:
+            return self._decode(converters, data)
+        except Exception:
+            # Invalid data is reported by the Django deserializer.
+            return None
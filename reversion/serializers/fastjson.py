@@ -0,0 +1,73 @@
+import json
+
+from django.core import serializers
+from django.core.serializers.base import DeserializationError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from reversion.serializers import BaseSerializer
+from reversion.serializers.json import JsonInstanceSerializer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+# Compact separators give the same output with and without orjson.
+_encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def dumps(data):
+    if orjson is not None:
+        try:
+            # Dates are passed to the Django encoder to keep the format of the Django JSON serializer.
+            return orjson.dumps(data, default=_encoder.default, option=orjson.OPT_PASSTHROUGH_DATETIME).decode()
+        except orjson.JSONEncodeError:
+            # E.g. integers out of the 64-bit range, the standard library handles them.
+            pass
+    return _encoder.encode(data)
+
+
+def loads(data):
+    # orjson decodes long non-ASCII strings slower than the standard library, ``str.isascii`` is a constant time check.
+    if orjson is not None and (not isinstance(data, str) or data.isascii()):
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJsonInstanceSerializer(JsonInstanceSerializer):
+
+    def _encode(self, data):
+        return dumps([data])
+
+
+class FastJsonSerializer(BaseSerializer):
+
+    """
+    JSON serializer using orjson if it is installed.
+
+    The data have the same structure as the Django JSON serializer output, so both formats can read each other's data.
+    """
+
+    format = 'fastjson'
+    supports_delta = True
+
+    def serialize_instance(self, instance, **options):
+        return self.compile_instance_serializer(instance.__class__, **options)(instance)
+
+    def compile_instance_serializer(self, model, fields=None, use_natural_foreign_keys=False):
+        return FastJsonInstanceSerializer(model, fields=fields, use_natural_foreign_keys=use_natural_foreign_keys)
+
+    def deserialize_instance(self, data, **options):
+        try:
+            return list(serializers.deserialize('python', loads(data), ignorenonexistent=True, **options))[0]
+        except (GeneratorExit, DeserializationError):
+            raise
+        except Exception as ex:
+            raise DeserializationError() from ex
+
+    def _deserialize_raw(self, data):
+        return loads(data)
+
+    def _serialize_raw(self, objects):
+        return dumps(objects)
@@ -1,11 +1,104 @@
 import json
+from functools import partial
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.encoding import is_protected_type
 
 from reversion.serializers import BaseSerializer
 
 
+def _value_from_field(obj, field):
+    value = field.value_from_object(obj)
+    # Same as the Django python serializer, only protected types are passed through as is.
+    return value if is_protected_type(value) else field.value_to_string(obj)
+
+
+def _natural_key_from_fk_field(obj, field):
+    related = getattr(obj, field.name)
+    return related.natural_key() if related else None
+
+
+def _m2m_values(obj, field, m2m_value):
+    m2m_iter = getattr(obj, '_prefetched_objects_cache', {}).get(field.name)
+    if m2m_iter is None:
+        m2m_iter = getattr(obj, field.name).iterator()
+    return [m2m_value(related) for related in m2m_iter]
+
+
+def _m2m_natural_key(related):
+    return related.natural_key()
+
+
+def _m2m_pk(related):
+    return _value_from_field(related, related._meta.pk)
+
+
+class JsonInstanceSerializer:
+
+    """
+    Serializes instances of one model to the same payload as the Django JSON serializer.
+
+    Field accessors are prepared on the first call, when all model relations are resolved.
+    """
+
+    def __init__(self, model, fields=None, use_natural_foreign_keys=False):
+        self.model = model
+        self.fields = fields
+        self.use_natural_foreign_keys = use_natural_foreign_keys
+        self._label = str(model._meta)
+        self._encoder = DjangoJSONEncoder(ensure_ascii=False)
+        self._accessors = None
+
+    def _get_accessors(self):
+        selected_fields = self.fields
+        accessors = []
+        for field in self.model._meta.concrete_model._meta.local_fields:
+            if not field.serialize:
+                continue
+            if field.remote_field is None:
+                if selected_fields is None or field.attname in selected_fields:
+                    accessors.append((field.name, partial(_value_from_field, field=field)))
+            elif selected_fields is None or field.attname[:-3] in selected_fields:
+                if self.use_natural_foreign_keys and hasattr(field.remote_field.model, 'natural_key'):
+                    accessors.append((field.name, partial(_natural_key_from_fk_field, field=field)))
+                else:
+                    accessors.append((field.name, partial(_value_from_field, field=field)))
+        for field in self.model._meta.concrete_model._meta.local_many_to_many:
+            if not field.serialize or not field.remote_field.through._meta.auto_created:
+                continue
+            if selected_fields is None or field.attname in selected_fields:
+                if self.use_natural_foreign_keys and hasattr(field.remote_field.model, 'natural_key'):
+                    m2m_value = _m2m_natural_key
+                else:
+                    m2m_value = _m2m_pk
+                accessors.append((field.name, partial(_m2m_values, field=field, m2m_value=m2m_value)))
+        return tuple(accessors)
+
+    def __call__(self, instance):
+        accessors = self._accessors
+        if accessors is None:
+            accessors = self._accessors = self._get_accessors()
+        data = {
+            'model': self._label,
+            'pk': _value_from_field(instance, instance._meta.pk),
+            'fields': {name: accessor(instance) for name, accessor in accessors},
+        }
+        return self._encode(data)
+
+    def _encode(self, data):
+        return '[' + self._encoder.encode(data) + ']'
+
+
 class JsonSerializer(BaseSerializer):
 
     format = 'json'
+    supports_delta = True
+
+    def compile_instance_serializer(self, model, fields=None, use_natural_foreign_keys=False):
+        return JsonInstanceSerializer(model, fields=fields, use_natural_foreign_keys=use_natural_foreign_keys)
 
     def _deserialize_raw(self, data):
         return json.loads(data)
+
+    def _serialize_raw(self, objects):
+        return json.dumps(objects, cls=DjangoJSONEncoder, ensure_ascii=False)
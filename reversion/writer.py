@@ -0,0 +1,165 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections
+
+from reversion.conf import get_config
+
+
+logger = logging.getLogger(__name__)
+
+
+FULL_POLICY_BLOCK = 'block'
+FULL_POLICY_SYNC = 'sync'
+FULL_POLICY_DROP = 'drop'
+
+FULL_POLICIES = (FULL_POLICY_BLOCK, FULL_POLICY_SYNC, FULL_POLICY_DROP)
+
+
+_STOP = object()
+
+
+class RevisionWriter:
+
+    """
+    Saves revisions in background threads.
+
+    Jobs are stored in a bounded in-memory queue. When the queue is full, ``full_policy`` decides whether the caller
+    waits for a free slot (``block``), saves the revision in the calling thread (``sync``) or drops the revision
+    (``drop``).
+    """
+
+    def __init__(self, workers=1, queue_size=1000, full_policy=FULL_POLICY_BLOCK):
+        if full_policy not in FULL_POLICIES:
+            raise ImproperlyConfigured('Invalid reversion async commit full policy "{}"'.format(full_policy))
+        self.workers = workers
+        self.full_policy = full_policy
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._counters = {
+            'submitted': 0,
+            'committed': 0,
+            'failed': 0,
+            'dropped': 0,
+            'committed_sync': 0,
+        }
+
+    def _increment(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(
+                    target=self._work, name='reversion-writer-{}'.format(i), daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def _call(self, func, args, kwargs):
+        try:
+            func(*args, **kwargs)
+            return True
+        except Exception:
+            logger.exception('Asynchronous revision commit failed')
+            self._increment('failed')
+            return False
+
+    def _run(self, func, args, kwargs):
+        close_old_connections()
+        try:
+            return self._call(func, args, kwargs)
+        finally:
+            close_old_connections()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is _STOP:
+                    return
+                if self._run(*job):
+                    self._increment('committed')
+            finally:
+                self._queue.task_done()
+
+    def submit(self, func, *args, **kwargs):
+        self._start()
+        self._increment('submitted')
+        job = (func, args, kwargs)
+        if self.full_policy == FULL_POLICY_BLOCK:
+            self._queue.put(job)
+            return
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            if self.full_policy == FULL_POLICY_SYNC:
+                # Failures are logged and counted like in the worker threads, the request data is already committed.
+                # Connections of the calling thread are left open.
+                if self._call(func, args, kwargs):
+                    self._increment('committed_sync')
+            else:
+                logger.warning('Asynchronous revision commit queue is full, revision was dropped')
+                self._increment('dropped')
+
+    def flush(self):
+        """Waits until all submitted revisions are saved."""
+        self._queue.join()
+
+    def shutdown(self):
+        """Saves all submitted revisions and stops the worker threads."""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(_STOP)
+        for thread in threads:
+            thread.join()
+
+    def get_metrics(self):
+        with self._lock:
+            metrics = dict(self._counters)
+        metrics['queued'] = self._queue.qsize()
+        return metrics
+
+
+_writer = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer, _writer_pid
+    with _writer_lock:
+        # Worker threads do not survive a fork, the child process needs its own writer.
+        if _writer is None or _writer_pid != os.getpid():
+            config = get_config()
+            _writer = RevisionWriter(
+                workers=config.async_commit_workers,
+                queue_size=config.async_commit_queue_size,
+                full_policy=config.async_commit_full_policy,
+            )
+            _writer_pid = os.getpid()
+        return _writer
+
+
+def flush():
+    if _writer is not None:
+        _writer.flush()
+
+
+def get_metrics():
+    return get_writer().get_metrics()
+
+
+@atexit.register
+def _shutdown():
+    if _writer is not None and _writer_pid == os.getpid():
+        _writer.shutdown()
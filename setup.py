@@ -40,6 +40,7 @@ setup(
     ],
     extras_require={
         'dynamodb': ['pydjamodb>=0.0.10', 'pynamodb>=5.3.4'],
+        'zstd': ['zstandard'],
     },
     python_requires='>=3.6',
     classifiers=[
@@ -0,0 +1,92 @@
+"""
+Compares the compiled version serializer and field dict decoder with the Django serializers, and the throughput of
+the ``json`` and ``fastjson`` formats on a text heavy instance.
+
+Run from the repository root: ``python tests/benchmarks/serializers.py [number]``
+"""
+import os
+import sys
+import timeit
+from functools import partial
+
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "test_project.settings")
+
+
+def main(number):
+    import django
+
+    django.setup()
+
+    from django.core import serializers
+
+    import reversion
+    from reversion.revisions import _get_options
+    from reversion.serializers import compile_instance_serializer, compile_field_dict_deserializer
+    from test_app.models import TestModel, TestModelRelated
+
+    if not reversion.is_registered(TestModel):
+        reversion.register(TestModel)
+    version_options = _get_options(TestModel)
+    obj = TestModel(pk=1, name="v1")
+    # Prefetched relations keep the benchmark away from the database.
+    related = TestModelRelated.objects.all()
+    related._result_cache = [TestModelRelated(pk=pk) for pk in range(10)]
+    related._prefetch_done = True
+    obj._prefetched_objects_cache = {"related": related}
+
+    def serialize_django():
+        serializers.serialize(
+            version_options.format,
+            (obj,),
+            fields=version_options.fields,
+            use_natural_foreign_keys=version_options.use_natural_foreign_keys,
+        )
+
+    def serialize_compiled():
+        version_options.serializer(obj)
+
+    assert version_options.serializer(obj) == serializers.serialize(
+        version_options.format, (obj,), fields=version_options.fields,
+    )
+    data = version_options.serializer(obj)
+
+    def deserialize_django():
+        object_version = list(serializers.deserialize(version_options.format, data, ignorenonexistent=True))[0]
+        field_dict = {"related": object_version.m2m_data["related"]}
+        for field_name in version_options.fields:
+            if field_name != "related":
+                field_dict[field_name] = getattr(object_version.object, field_name)
+
+    def deserialize_compiled():
+        version_options.deserializer(data)
+
+    benchmarks = [
+        ("serialize django", serialize_django),
+        ("serialize compiled", serialize_compiled),
+        ("field dict django", deserialize_django),
+        ("field dict compiled", deserialize_compiled),
+    ]
+
+    for text_name, text in (
+        ("ascii", "Lorem ipsum dolor sit amet. " * 3500),
+        ("unicode", "Příliš žluťoučký kůň úpěl ďábelské ódy. " * 2500),
+    ):
+        text_obj = TestModel(pk=1, name=text)
+        text_obj._prefetched_objects_cache = {"related": related}
+        for format in ("json", "fastjson"):
+            serializer = compile_instance_serializer(format, TestModel, fields=version_options.fields)
+            deserializer = compile_field_dict_deserializer(format, TestModel, fields=version_options.fields)
+            benchmarks += [
+                ("encode {} {}".format(text_name, format), partial(serializer, text_obj)),
+                ("decode {} {}".format(text_name, format), partial(deserializer, serializer(text_obj))),
+            ]
+
+    for name, func in benchmarks:
+        seconds = min(timeit.repeat(func, number=number, repeat=3))
+        print("{:<24} {:>12.0f} ops/sec".format(name, number / seconds))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
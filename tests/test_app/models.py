@@ -142,3 +142,19 @@ class TestModelInlineByNaturalKey(models.Model):
         TestModelWithNaturalKey,
         on_delete=models.CASCADE,
     )
+
+
+class TestModelAutoNow(models.Model):
+
+    name = models.CharField(
+        max_length=191,
+        default="v1",
+    )
+
+    date_created = models.DateTimeField(
+        auto_now_add=True,
+    )
+
+    date_updated = models.DateTimeField(
+        auto_now=True,
+    )
@@ -1,13 +1,25 @@
+import json
 from datetime import timedelta
 from unittest.mock import MagicMock
 
 from django.contrib.auth.models import User
-from django.db import models
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.sql import emit_post_migrate_signal
+from django.db import connection, models, transaction
 from django.db.transaction import get_connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from django.test.utils import override_settings
 import reversion
-from test_app.models import TestModel, TestModelRelated, TestModelThrough, TestModelParent, TestMeta
+from reversion.backends import Backend, get_backend, set_backend
+from reversion.backends.sql.models import Revision, Version
+from reversion.conf import get_config
+from reversion.restore import restore
+from reversion.revisions import _get_content_type
+from test_app.models import (
+    TestModel, TestModelRelated, TestModelThrough, TestModelParent, TestMeta, TestModelInline, TestModelNestedInline,
+)
 from test_app.tests.base import TestBase, TestBaseTransaction, TestModelMixin, UserMixin
 
 
@@ -74,6 +86,28 @@ class UnregisterTest(TestModelMixin, TestBase):
         self.assertFalse(reversion.is_registered(TestModel))
 
 
+class GetContentTypeTest(TestModelMixin, TestBase):
+
+    def testGetContentTypeCached(self):
+        content_type = _get_content_type(TestModel, "default")
+        ContentType.objects.clear_cache()
+        with self.assertNumQueries(0):
+            self.assertEqual(_get_content_type(TestModel, "default"), content_type)
+
+    def testGetContentTypeUnregister(self):
+        _get_content_type(TestModel, "default")
+        reversion.unregister(TestModel)
+        with self.assertRaises(reversion.RegistrationError):
+            _get_content_type(TestModel, "default")
+
+    def testGetContentTypePostMigrate(self):
+        _get_content_type(TestModel, "default")
+        emit_post_migrate_signal(verbosity=0, interactive=False, db="default")
+        ContentType.objects.clear_cache()
+        with self.assertNumQueries(1):
+            _get_content_type(TestModel, "default")
+
+
 class UnregisterUnregisteredTest(TestBase):
 
     def testUnregisterNotRegistered(self):
@@ -81,6 +115,59 @@ class UnregisterUnregisteredTest(TestBase):
             reversion.unregister(User)
 
 
+class GetConfigTest(TestBase):
+
+    def testGetConfig(self):
+        self.assertIs(get_config(), get_config())
+
+    def testGetConfigSettingChanged(self):
+        self.assertTrue(get_config().enabled)
+        with override_settings(REVERSION_ENABLED=False):
+            self.assertFalse(get_config().enabled)
+        self.assertTrue(get_config().enabled)
+
+
+class GetBackendTest(TestModelMixin, TestBase):
+
+    def testGetBackend(self):
+        self.assertEqual(get_backend().name, "sql")
+        self.assertIs(get_backend(), get_backend())
+
+    @override_settings(REVERSION_BACKEND="dynamodb")
+    def testGetBackendSetting(self):
+        self.assertEqual(get_backend().name, "dynamodb")
+
+    @override_settings(REVERSION_BACKEND="boom")
+    def testGetBackendNotInstalled(self):
+        with self.assertRaises(ImproperlyConfigured):
+            get_backend()
+
+    def testSetBackend(self):
+        sql_backend = get_backend()
+        saved_versions = []
+
+        class TestBackend(Backend):
+
+            def prepare_version_object(self, *args):
+                return sql_backend.prepare_version_object(*args)
+
+            def save_revision(self, date_created, user, comment, versions, using):
+                saved_versions.extend(versions)
+
+            def get_db_name(self):
+                return sql_backend.get_db_name()
+
+        set_backend(TestBackend())
+        try:
+            with reversion.create_revision():
+                TestModel.objects.create()
+        finally:
+            set_backend(None)
+        self.assertEqual(len(saved_versions), 1)
+        self.assertIs(get_backend(), sql_backend)
+        self.assertNoRevision()
+
+
 class CreateRevisionTest(TestModelMixin, TestBase):
 
     def testCreateRevision(self):
@@ -135,6 +222,101 @@ class CreateRevisionTest(TestModelMixin, TestBase):
         self.assertEqual(_callback.call_count, 1)
 
 
+class CreateRevisionBulkTest(TestModelMixin, TestBase):
+
+    def _count_version_inserts(self, queries):
+        return len([
+            query for query in queries
+            if query["sql"].startswith("INSERT") and "reversion_backends_sql_version" in query["sql"]
+        ])
+
+    def testCreateRevisionBulkInsert(self):
+        with CaptureQueriesContext(connection) as queries:
+            with reversion.create_revision():
+                objs = [TestModel.objects.create() for _ in range(3)]
+        self.assertEqual(self._count_version_inserts(queries), 1)
+        self.assertSingleRevision(objs)
+
+    @override_settings(REVERSION_BULK_CREATE_BATCH_SIZE=2)
+    def testCreateRevisionBulkInsertBatchSize(self):
+        with CaptureQueriesContext(connection) as queries:
+            with reversion.create_revision():
+                objs = [TestModel.objects.create() for _ in range(3)]
+        self.assertEqual(self._count_version_inserts(queries), 2)
+        self.assertSingleRevision(objs)
+
+    def testPostRevisionCommitSignalVersionPks(self):
+        if not connection.features.can_return_rows_from_bulk_insert:
+            self.skipTest("Database cannot return rows from a bulk insert.")
+        _callback = MagicMock()
+        reversion.signals.post_revision_commit.connect(_callback)
+        try:
+            with reversion.create_revision():
+                TestModel.objects.create()
+        finally:
+            reversion.signals.post_revision_commit.disconnect(_callback)
+        versions = _callback.call_args[1]["versions"]
+        self.assertTrue(all(version.pk is not None for version in versions))
+
+
+class CreateRevisionExistenceCheckTest(TestModelMixin, TestBase):
+
+    def _count_existence_checks(self, queries):
+        return len([
+            query for query in queries
+            if query["sql"].startswith("SELECT") and 'FROM "test_app_testmodel"' in query["sql"]
+        ])
+
+    def testCreateRevisionSavedObjectNotChecked(self):
+        with CaptureQueriesContext(connection) as queries:
+            with reversion.create_revision():
+                obj = TestModel.objects.create()
+        self.assertEqual(self._count_existence_checks(queries), 0)
+        self.assertSingleRevision((obj,))
+
+    def testCreateRevisionAddedObjectChecked(self):
+        obj = TestModel.objects.create()
+        with CaptureQueriesContext(connection) as queries:
+            with reversion.create_revision():
+                reversion.add_to_revision(obj)
+        self.assertEqual(self._count_existence_checks(queries), 1)
+        self.assertSingleRevision((obj,))
+
+    def testCreateRevisionSavedObjectDeleted(self):
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+            obj.delete()
+        self.assertNoRevision()
+
+    def testCreateRevisionAddedObjectDeleted(self):
+        obj = TestModel.objects.create()
+        with reversion.create_revision():
+            reversion.add_to_revision(obj)
+            TestModel.objects.filter(pk=obj.pk).delete()
+        self.assertNoRevision()
+
+    def testCreateRevisionSavedObjectRolledBack(self):
+        with reversion.create_revision():
+            obj_1 = TestModel.objects.create()
+            try:
+                with transaction.atomic():
+                    TestModel.objects.create()
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(
+            [version.object_id for version in Version.objects.get_for_model(TestModel)], [str(obj_1.pk)],
+        )
+
+    def testCreateRevisionSavedObjectInSavepointChecked(self):
+        with CaptureQueriesContext(connection) as queries:
+            with reversion.create_revision():
+                with transaction.atomic():
+                    obj = TestModel.objects.create()
+        self.assertEqual(self._count_existence_checks(queries), 1)
+        self.assertSingleRevision((obj,))
+
+
 class CreateRevisionAtomicTest(TestModelMixin, TestBaseTransaction):
 
     def testCreateRevisionAtomic(self):
@@ -214,6 +396,15 @@ class CreateRevisionDbTest(TestModelMixin, TestBase):
         self.assertSingleRevision((obj,), using="mysql")
         self.assertSingleRevision((obj,), using="postgres")
 
+    def testCreateRevisionNestedMultiDb(self):
+        with reversion.create_revision():
+            obj_1 = TestModel.objects.create()
+            with reversion.create_revision(using="postgres"):
+                obj_2 = TestModel.objects.create()
+            obj_3 = TestModel.objects.create()
+        self.assertSingleRevision((obj_1, obj_2, obj_3))
+        self.assertSingleRevision((obj_2,), using="postgres")
+
 
 class CreateRevisionFollowTest(TestBase):
 
@@ -239,6 +430,24 @@ class CreateRevisionFollowTest(TestBase):
             )
         self.assertSingleRevision((obj, obj_through, obj_related))
 
+    def testCreateRevisionFollowBatched(self):
+        reversion.register(TestModel, fields=("name",), follow=("testmodelinline_set",))
+        reversion.register(TestModelInline, follow=("testmodelnestedinline_set",))
+        reversion.register(TestModelNestedInline)
+        obj = TestModel.objects.create()
+        for _ in range(5):
+            obj_inline = TestModelInline.objects.create(test_model=obj)
+            for _ in range(2):
+                TestModelNestedInline.objects.create(test_model_inline=obj_inline)
+        with reversion.create_revision():
+            reversion.add_to_revision(obj)
+        self.assertEqual(Version.objects.count(), 16)
+        with reversion.create_revision():
+            # One query for each level of the followed relations.
+            with self.assertNumQueries(2):
+                reversion.add_to_revision(obj)
+        self.assertEqual(getattr(obj, "_prefetched_objects_cache", {}), {})
+
     def testCreateRevisionFollowInvalid(self):
         reversion.register(TestModel, follow=("name",))
         with reversion.create_revision():
@@ -256,6 +465,69 @@ class CreateRevisionIgnoreDuplicatesTest(TestBase):
             obj.save()
         self.assertSingleRevision((obj,))
 
+    def testCreateRevisionIgnoreDuplicatesChanged(self):
+        reversion.register(TestModel, ignore_duplicates=True)
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        with reversion.create_revision():
+            obj.name = "v2"
+            obj.save()
+        self.assertEqual(Revision.objects.count(), 2)
+
+    def testCreateRevisionIgnoreDuplicatesM2MOrder(self):
+        reversion.register(TestModel, ignore_duplicates=True)
+        obj_related = [TestModelRelated.objects.create(), TestModelRelated.objects.create()]
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+            obj.related.add(*obj_related)
+        version = Version.objects.get_for_object(obj).get()
+        data = json.loads(version.serialized_data)
+        data[0]["fields"]["related"].reverse()
+        Version.objects.filter(pk=version.pk).update(serialized_data=json.dumps(data))
+        with reversion.create_revision():
+            obj.save()
+        self.assertSingleRevision((obj,))
+
+    def testCreateRevisionIgnoreDuplicatesFollow(self):
+        reversion.register(TestModel, ignore_duplicates=True, follow=("related",))
+        reversion.register(TestModelRelated)
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+            obj.related.add(TestModelRelated.objects.create())
+        with reversion.create_revision():
+            obj.save()
+        self.assertEqual(Revision.objects.count(), 1)
+
+    def testCreateRevisionIgnoreDuplicatesFollowChanged(self):
+        reversion.register(TestModel, ignore_duplicates=True, follow=("related",))
+        reversion.register(TestModelRelated)
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+            obj.related.add(TestModelRelated.objects.create())
+        with reversion.create_revision():
+            obj.save()
+            obj_2 = TestModel.objects.create()
+            obj_2.related.add(obj.related.get())
+        self.assertEqual(Revision.objects.count(), 2)
+        self.assertEqual(Version.objects.get_for_object(obj).count(), 1)
+        self.assertEqual(Version.objects.get_for_object(obj.related.get()).count(), 2)
+
+    def testCreateRevisionIgnoreDuplicatesQueries(self):
+        reversion.register(TestModel, fields=("name",), ignore_duplicates=True)
+        with reversion.create_revision():
+            objs = [TestModel.objects.create(name="v{}".format(i)) for i in range(5)]
+
+        def count_save_queries(objs):
+            with CaptureQueriesContext(connection) as queries:
+                with reversion.create_revision():
+                    for obj in objs:
+                        obj.name += "+"
+                        obj.save()
+            return len(queries)
+
+        self.assertEqual(count_save_queries(objs[:1]), count_save_queries(objs[1:]) - len(objs[1:]) + 1)
+        self.assertEqual(Version.objects.count(), 10)
+
 
 class CreateRevisionInheritanceTest(TestModelMixin, TestBase):
 
@@ -375,3 +647,38 @@ class AddMetaTest(TestModelMixin, TestBase):
         self.assertNoRevision()
         self.assertSingleRevision((obj,), meta_names=("meta v1",), using="mysql")
         self.assertSingleRevision((obj,), meta_names=("meta v1",), using="postgres")
+
+
+class RestoreTest(TestModelMixin, TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.date = timezone.now() - timedelta(days=1)
+        with reversion.create_revision():
+            reversion.set_date_created(self.date)
+            self.obj_1 = TestModel.objects.create(name="obj_1 v1")
+            self.obj_2 = TestModel.objects.create(name="obj_2 v1")
+        with reversion.create_revision():
+            self.obj_1.name = "obj_1 v2"
+            self.obj_1.save()
+            self.obj_3 = TestModel.objects.create(name="obj_3 v1")
+        self.obj_2.delete()
+
+    def assertRestored(self):
+        self.assertEqual(
+            list(TestModel.objects.order_by("pk").values_list("name", flat=True)),
+            ["obj_1 v1", "obj_2 v1", "obj_3 v1"],
+        )
+
+    def testRestore(self):
+        self.assertEqual(restore(TestModel, self.date), 2)
+        self.assertRestored()
+
+    def testRestoreBulk(self):
+        self.assertEqual(restore(TestModel, self.date, bulk=True), 2)
+        self.assertRestored()
+
+    def testRestoreProgress(self):
+        progress = MagicMock()
+        restore(TestModel, self.date, batch_size=1, progress=progress)
+        self.assertEqual([call.args for call in progress.call_args_list], [(1,), (2,)])
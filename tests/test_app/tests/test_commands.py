@@ -1,10 +1,17 @@
 import json
 from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
 from django.core.management import CommandError
+from django.db import connections
+from django.db.models import QuerySet
+from django.test.utils import override_settings
 from django.utils import timezone
 import reversion
-from test_app.models import TestModel
-from test_app.tests.base import TestBase, TestModelMixin
+from reversion.backends.dynamodb.models import Version as DynamoDBVersion
+from reversion.backends.sql.models import Revision, Version, VersionPayload
+from test_app.models import TestModel, TestModelRelated
+from test_app.tests.base import TestBase, TestBaseTransaction, TestModelMixin
 
 
 class CreateInitialRevisionsTest(TestModelMixin, TestBase):
@@ -20,6 +27,28 @@ class CreateInitialRevisionsTest(TestModelMixin, TestBase):
         self.callCommand("createinitialrevisions")
         self.assertSingleRevision((obj,), comment="Initial version.")
 
+    def testCreateInitialRevisionsBatchSize(self):
+        objs = [TestModel.objects.create() for _ in range(3)]
+        self.callCommand("createinitialrevisions", batch_size=2)
+        for obj in objs:
+            self.assertSingleRevision((obj,), comment="Initial version.")
+
+    def testCreateInitialRevisionsWithoutSubquery(self):
+        objs = [TestModel.objects.create() for _ in range(3)]
+        self.callCommand("createinitialrevisions", "test_app.TestModel", batch_size=2)
+        new_obj = TestModel.objects.create()
+        with patch("reversion.backends.sql.models._can_subquery", return_value=False):
+            self.callCommand("createinitialrevisions", "test_app.TestModel", batch_size=2)
+        for obj in objs + [new_obj]:
+            self.assertSingleRevision((obj,), comment="Initial version.")
+
+    @override_settings(REVERSION_BACKEND="dynamodb")
+    def testCreateInitialRevisionsDynamoDB(self):
+        obj = TestModel.objects.create()
+        self.callCommand("createinitialrevisions")
+        self.callCommand("createinitialrevisions")
+        self.assertEqual(DynamoDBVersion.objects.get_for_object(obj).count(), 1)
+
 
 class CreateInitialRevisionsAppLabelTest(TestModelMixin, TestBase):
 
@@ -76,6 +105,24 @@ class CreateInitialRevisionsModelDbTest(TestModelMixin, TestBase):
         self.assertSingleRevision((obj,), comment="Initial version.", model_db="postgres")
 
 
+class CreateInitialRevisionsWorkersTest(TestModelMixin, TestBaseTransaction):
+    databases = {"default", "mysql", "postgres"}
+
+    def setUp(self):
+        super().setUp()
+        for alias in ("mysql", "postgres"):
+            if connections[alias].vendor == "sqlite" and connections[alias].is_in_memory_db():
+                self.skipTest("Worker processes need database files shared with the test process.")
+
+    def testCreateInitialRevisionsWorkers(self):
+        objs = [TestModel.objects.db_manager("postgres").create() for _ in range(5)]
+        self.callCommand(
+            "createinitialrevisions", using="mysql", model_db="postgres", batch_size=2, workers=2,
+        )
+        for obj in objs:
+            self.assertSingleRevision((obj,), comment="Initial version.", using="mysql", model_db="postgres")
+
+
 class CreateInitialRevisionsCommentTest(TestModelMixin, TestBase):
 
     def testCreateInitialRevisionsComment(self):
@@ -207,3 +254,162 @@ class DeleteRevisionsKeepTest(TestModelMixin, TestBase):
         self.assertSingleRevision((obj_1,), comment="obj_1 v2")
         self.assertSingleRevision((obj_2,), comment="obj_2 v2")
         self.assertSingleRevision((obj_3,))
+
+    def testDeleteRevisionsKeepBatchSize(self):
+        with reversion.create_revision():
+            obj_1 = TestModel.objects.create()
+        with reversion.create_revision():
+            obj_2 = TestModel.objects.create()
+        with reversion.create_revision():
+            obj_1.save()
+            reversion.set_comment("obj_1 v2")
+        self.callCommand("deleterevisions", keep=1, batch_size=1)
+        self.assertSingleRevision((obj_1,), comment="obj_1 v2")
+        self.assertSingleRevision((obj_2,))
+
+    def testDeleteRevisionsDeltaBatchSize(self):
+        reversion.unregister(TestModel)
+        reversion.register(TestModel, delta=10)
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        for name in ("v2", "v3", "v4"):
+            with reversion.create_revision():
+                obj.name = name
+                obj.save()
+        self.callCommand("deleterevisions", keep=1, batch_size=1)
+        self.assertEqual(Version.objects.get_for_object(obj).count(), 2)
+        self.assertEqual(Version.objects.get_for_object(obj).first().field_dict["name"], "v4")
+        self.callCommand("deleterevisions", batch_size=1)
+        self.assertNoRevision()
+
+
+class DeleteRevisionsPayloadTest(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        reversion.register(TestModel, deduplicate=True)
+
+    def testDeleteRevisionsPayload(self):
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        with reversion.create_revision():
+            obj.name = "v2"
+            obj.save()
+        self.callCommand("deleterevisions", keep=1)
+        self.assertEqual(VersionPayload.objects.count(), 1)
+        self.assertEqual(Version.objects.get_for_object(obj).get().field_dict["name"], "v2")
+
+    def testDeleteRevisionsPayloadReferencedMeanwhile(self):
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        Revision.objects.all().delete()
+        select_for_update = QuerySet.select_for_update
+        pending_saves = [obj]
+
+        def save_before_select_for_update(queryset, *args, **kwargs):
+            # A version using the unreferenced payload is saved before the payloads are locked.
+            while pending_saves:
+                with reversion.create_revision():
+                    pending_saves.pop().save()
+            return select_for_update(queryset, *args, **kwargs)
+
+        with patch.object(QuerySet, "select_for_update", save_before_select_for_update):
+            self.callCommand("deleterevisions", days=1)
+        self.assertEqual(VersionPayload.objects.count(), 1)
+        self.assertEqual(Version.objects.get_for_object(obj).get().field_dict["name"], "v1")
+
+
+class DeleteRevisionsDryRunTest(TestModelMixin, TestBase):
+
+    def testDeleteRevisionsDryRun(self):
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        stdout = StringIO()
+        self.callCommand("deleterevisions", dry_run=True, stdout=stdout)
+        self.assertIn("Found 1 revisions", stdout.getvalue())
+        self.assertSingleRevision((obj,))
+
+
+@override_settings(REVERSION_BACKEND="dynamodb")
+class DeleteDynamoDBRevisionsTest(TestModelMixin, TestBase):
+
+    def testDeleteDynamoDBRevisions(self):
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        self.callCommand("deletedynamodbrevisions")
+        self.assertEqual(DynamoDBVersion.objects.get_for_object(obj).count(), 0)
+
+    def testDeleteDynamoDBRevisionsKeep(self):
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        with reversion.create_revision():
+            obj.save()
+            reversion.set_comment("v2")
+        self.callCommand("deletedynamodbrevisions", keep=1, workers=2)
+        self.assertEqual([version.comment for version in DynamoDBVersion.objects.get_for_object(obj)], ["v2"])
+
+    def testDeleteDynamoDBRevisionsDryRun(self):
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        self.callCommand("deletedynamodbrevisions", dry_run=True)
+        self.assertEqual(DynamoDBVersion.objects.get_for_object(obj).count(), 1)
+
+    def testDeleteDynamoDBRevisionsDelta(self):
+        reversion.unregister(TestModel)
+        reversion.register(TestModel, delta=10)
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        for name in ("v2", "v3", "v4"):
+            with reversion.create_revision():
+                obj.name = name
+                obj.save()
+        self.callCommand("deletedynamodbrevisions", batch_size=1)
+        self.assertEqual(DynamoDBVersion.objects.get_for_object(obj).count(), 0)
+
+    def testDeleteDynamoDBRevisionsSeveralModels(self):
+        reversion.register(TestModelRelated)
+        with reversion.create_revision():
+            TestModel.objects.create()
+            TestModelRelated.objects.create()
+            TestModelRelated.objects.create()
+        stdout = StringIO()
+        self.callCommand("deletedynamodbrevisions", "test_app", dry_run=True, batch_size=1, stdout=stdout)
+        self.assertIn("Found 1 revisions", stdout.getvalue())
+        self.callCommand("deletedynamodbrevisions", "test_app", batch_size=1, stdout=stdout)
+        self.assertEqual(DynamoDBVersion.objects.get_for_model(TestModelRelated).count(), 0)
+
+
+class UpdateVersionHashesTest(TestModelMixin, TestBase):
+
+    def testUpdateVersionHashes(self):
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        content_hash = Version.objects.get_for_object(obj).get().content_hash
+        Version.objects.get_for_object(obj).update(content_hash="")
+        self.callCommand("updateversionhashes")
+        self.assertEqual(Version.objects.get_for_object(obj).get().content_hash, content_hash)
+
+    def testUpdateVersionHashesInvalidData(self):
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        Version.objects.get_for_object(obj).update(content_hash="", serialized_data="boom")
+        self.callCommand("updateversionhashes")
+        self.assertEqual(Version.objects.get_for_object(obj).get().content_hash, "")
+
+
+class RestoreVersionsTest(TestModelMixin, TestBase):
+
+    def testRestoreVersions(self):
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        date = Version.objects.get_for_object(obj).get().revision.date_created
+        with reversion.create_revision():
+            obj.name = "v2"
+            obj.save()
+        self.callCommand("restoreversions", date=date.isoformat())
+        obj.refresh_from_db()
+        self.assertEqual(obj.name, "v1")
+
+    def testRestoreVersionsInvalidDate(self):
+        with self.assertRaises(CommandError):
+            self.callCommand("restoreversions", date="boom")
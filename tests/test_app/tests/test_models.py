@@ -1,11 +1,19 @@
-from django.test.utils import override_settings
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+
+from django.db import connection
+from django.db.models.signals import post_save
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
 import reversion
-from reversion.backends.sql.models import Version
+from reversion.backends.sql.models import Version, VersionPayload
+from reversion.backends.utils import _get_revert_order, get_delta_keyframe_key
 from reversion.backends.dynamodb.models import Version as DynamoDBVersion
+from reversion.revisions import _follow_relations_recursive
 from test_app.models import (
     TestModel, TestModelRelated, TestModelParent, TestModelInline,
     TestModelNestedInline,
-    TestModelInlineByNaturalKey, TestModelWithNaturalKey,
+    TestModelInlineByNaturalKey, TestModelWithNaturalKey, TestModelAutoNow, TestModelEscapePK,
 )
 from test_app.tests.base import TestBase, TestModelMixin, TestModelParentMixin, TestModelParentWithoutFollowMixin
 import json
@@ -40,6 +48,46 @@ class GetForModelDbTest(TestModelMixin, TestBase):
         self.assertEqual(Version.objects.using("mysql").get_for_model(obj.__class__).count(), 1)
 
 
+class GetForModelAtTest(TestModelMixin, TestBase):
+
+    def testGetForModelAt(self):
+        date = timezone.now() - timedelta(days=1)
+        with reversion.create_revision():
+            reversion.set_date_created(date - timedelta(days=1))
+            obj_1 = TestModel.objects.create(name="obj_1 v1")
+        with reversion.create_revision():
+            reversion.set_date_created(date)
+            obj_1.name = "obj_1 v2"
+            obj_1.save()
+        with reversion.create_revision():
+            obj_1.name = "obj_1 v3"
+            obj_1.save()
+            TestModel.objects.create(name="obj_2 v1")
+        self.assertEqual(
+            [version.field_dict["name"] for version in Version.objects.get_for_model_at(TestModel, date)],
+            ["obj_1 v2"],
+        )
+
+    def testGetForModelAtBackDated(self):
+        date = timezone.now() - timedelta(days=1)
+        with reversion.create_revision():
+            reversion.set_date_created(date)
+            obj = TestModel.objects.create(name="v2")
+        with reversion.create_revision():
+            reversion.set_date_created(date - timedelta(days=1))
+            obj.name = "v1"
+            obj.save()
+        self.assertEqual(
+            [version.field_dict["name"] for version in Version.objects.get_for_model_at(TestModel, date)],
+            ["v2"],
+        )
+
+    def testGetForModelAtEmpty(self):
+        with reversion.create_revision():
+            TestModel.objects.create()
+        self.assertEqual(Version.objects.get_for_model_at(TestModel, timezone.now() - timedelta(days=1)).count(), 0)
+
+
 class GetForObjectTest(TestModelMixin, TestBase):
 
     def testGetForObject(self):
@@ -130,6 +178,23 @@ class GetForObjectUniqueTest(TestModelMixin, TestBase):
             obj.save()
         self.assertEqual(len(list(Version.objects.get_for_object(obj).get_unique())), 2)
 
+    def testGetForObjectUniqueContentHash(self):
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        with reversion.create_revision():
+            obj.save()
+        versions = list(Version.objects.get_for_object(obj).get_unique())
+        self.assertEqual(len(versions), 1)
+        self.assertNotIn("_serialized_data", versions[0].__dict__)
+
+    def testGetForObjectUniqueWithoutContentHash(self):
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        with reversion.create_revision():
+            obj.save()
+        Version.objects.get_for_object(obj).update(content_hash="")
+        self.assertEqual(len(list(Version.objects.get_for_object(obj).get_unique())), 1)
+
 
 class GetForObjectReferenceTest(TestModelMixin, TestBase):
 
@@ -575,6 +640,178 @@ class RevisionRevertDeleteTest(TestBase):
             list(child_a.testmodelnestedinline_set.all()), [grandchild_a]
         )
 
+    def testRevertDeleteQueries(self):
+        reversion.register(TestModel, follow=("testmodelinline_set",))
+        reversion.register(TestModelInline, follow=("testmodelnestedinline_set",))
+        reversion.register(TestModelNestedInline)
+
+        def count_revert_queries(inline_count, delete):
+            with reversion.create_revision():
+                parent = TestModel.objects.create()
+                for _ in range(inline_count):
+                    TestModelNestedInline.objects.create(
+                        test_model_inline=TestModelInline.objects.create(test_model=parent),
+                    )
+            with reversion.create_revision():
+                TestModelNestedInline.objects.create(
+                    test_model_inline=TestModelInline.objects.create(test_model=parent),
+                )
+                reversion.add_to_revision(parent)
+            revision = Version.objects.get_for_object(parent)[1].revision
+            with CaptureQueriesContext(connection) as queries:
+                revision.revert(delete=delete)
+            return len(queries)
+
+        # Loading and following the objects of the revision doesn't depend on the number of objects.
+        self.assertEqual(
+            count_revert_queries(1, True) - count_revert_queries(1, False),
+            count_revert_queries(10, True) - count_revert_queries(10, False),
+        )
+
+    def testFollowRelationsRecursiveQueries(self):
+        reversion.register(TestModel, follow=("testmodelinline_set",))
+        reversion.register(TestModelInline, follow=("testmodelnestedinline_set",))
+        reversion.register(TestModelNestedInline)
+        parent = TestModel.objects.create()
+        for _ in range(5):
+            TestModelNestedInline.objects.create(
+                test_model_inline=TestModelInline.objects.create(test_model=parent),
+            )
+        with self.assertNumQueries(2):
+            self.assertEqual(len(_follow_relations_recursive([parent])), 11)
+
+
+class RevisionRevertOrderTest(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        reversion.register(TestModel, follow=("testmodelinline_set",))
+        reversion.register(TestModelInline, follow=("testmodelnestedinline_set",))
+        reversion.register(TestModelNestedInline)
+
+    def testGetRevertOrder(self):
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+            TestModelNestedInline.objects.create(
+                test_model_inline=TestModelInline.objects.create(test_model=obj),
+            )
+        ordered_versions, cyclic_versions = _get_revert_order(
+            Version.objects.get_for_object(obj).get().revision.version_set.order_by("-pk")
+        )
+        self.assertEqual(
+            [version._model for version in ordered_versions],
+            [TestModel, TestModelInline, TestModelNestedInline],
+        )
+        self.assertEqual(cyclic_versions, [])
+
+    def testRevertOrdered(self):
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+            obj_nested_inline = TestModelNestedInline.objects.create(
+                test_model_inline=TestModelInline.objects.create(test_model=obj),
+            )
+        revision = Version.objects.get_for_object(obj).get().revision
+        obj.delete()
+        with patch("reversion.backends.utils._safe_revert") as safe_revert:
+            revision.revert()
+        safe_revert.assert_not_called()
+        self.assertEqual(TestModelNestedInline.objects.get().pk, obj_nested_inline.pk)
+
+
+class RevisionRevertBulkTest(TestBase):
+
+    def testRevertBulk(self):
+        reversion.register(TestModel)
+        with reversion.create_revision():
+            obj_1 = TestModel.objects.create(name="obj_1 v1")
+            obj_2 = TestModel.objects.create(name="obj_2 v1")
+        obj_1.name = "obj_1 v2"
+        obj_1.save()
+        obj_2_pk = obj_2.pk
+        obj_2.delete()
+        Version.objects.get_for_object(obj_1).get().revision.revert(bulk=True)
+        self.assertEqual(TestModel.objects.get(pk=obj_1.pk).name, "obj_1 v1")
+        self.assertEqual(TestModel.objects.get(pk=obj_2_pk).name, "obj_2 v1")
+
+    def testRevertBulkAutoNow(self):
+        reversion.register(TestModelAutoNow)
+        obj = TestModelAutoNow.objects.create()
+        date_created = timezone.now().replace(microsecond=0) - timedelta(days=1)
+        TestModelAutoNow.objects.filter(pk=obj.pk).update(date_created=date_created, date_updated=date_created)
+        obj.refresh_from_db()
+        with reversion.create_revision():
+            reversion.add_to_revision(obj)
+        obj_pk = obj.pk
+        obj.delete()
+        Version.objects.get_for_object_reference(TestModelAutoNow, obj_pk).get().revision.revert(bulk=True)
+        obj = TestModelAutoNow.objects.get(pk=obj_pk)
+        self.assertEqual((obj.date_created, obj.date_updated), (date_created, date_created))
+
+    def testRevertBulkCustomPrimaryKey(self):
+        reversion.register(TestModelEscapePK)
+        with reversion.create_revision():
+            TestModelEscapePK.objects.create(name="a/b")
+            TestModelEscapePK.objects.create(name="c")
+        TestModelEscapePK.objects.filter(name="c").delete()
+        Version.objects.get_for_object_reference(TestModelEscapePK, "a/b").get().revision.revert(bulk=True)
+        self.assertEqual(sorted(TestModelEscapePK.objects.values_list("name", flat=True)), ["a/b", "c"])
+
+    def testRevertBulkWithoutRawInsert(self):
+        reversion.register(TestModel)
+        with reversion.create_revision():
+            obj = TestModel.objects.create(name="v1")
+        obj_pk = obj.pk
+        obj.delete()
+        with patch("reversion.backends.utils.RAW_INSERT_DJANGO_VERSIONS", ()):
+            Version.objects.get_for_object_reference(TestModel, obj_pk).get().revision.revert(bulk=True)
+        self.assertEqual(TestModel.objects.get(pk=obj_pk).name, "v1")
+
+    def testRevertBulkM2M(self):
+        reversion.register(TestModel)
+        obj_related_1 = TestModelRelated.objects.create()
+        obj_related_2 = TestModelRelated.objects.create()
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+            obj.related.add(obj_related_1)
+        obj.related.set([obj_related_2])
+        Version.objects.get_for_object(obj).get().revision.revert(bulk=True)
+        self.assertEqual(list(obj.related.all()), [obj_related_1])
+
+    def testRevertBulkInheritance(self):
+        reversion.register(TestModel)
+        reversion.register(TestModelParent, follow=("testmodel_ptr",))
+        with reversion.create_revision():
+            obj = TestModelParent.objects.create(name="v1", parent_name="parent v1")
+        TestModelParent.objects.filter(pk=obj.pk).update(name="v2", parent_name="parent v2")
+        Version.objects.get_for_object(obj).get().revision.revert(bulk=True)
+        obj.refresh_from_db()
+        self.assertEqual((obj.name, obj.parent_name), ("v1", "parent v1"))
+
+    def testRevertBulkSignals(self):
+        reversion.register(TestModel)
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        receiver = MagicMock()
+        post_save.connect(receiver, sender=TestModel)
+        try:
+            Version.objects.get_for_object(obj).get().revision.revert(bulk=True)
+        finally:
+            post_save.disconnect(receiver, sender=TestModel)
+        receiver.assert_not_called()
+
+    def testRevertBulkQueries(self):
+        reversion.register(TestModel, fields=("name",))
+
+        def count_revert_queries(obj_count):
+            with reversion.create_revision():
+                objs = [TestModel.objects.create() for _ in range(obj_count)]
+            revision = Version.objects.get_for_object(objs[0]).get().revision
+            with CaptureQueriesContext(connection) as queries:
+                revision.revert(bulk=True)
+            return len(queries)
+
+        self.assertEqual(count_revert_queries(1), count_revert_queries(10))
+
 
 class NaturalKeyTest(TestBase):
 
@@ -595,3 +832,281 @@ class NaturalKeyTest(TestBase):
             'test_model_id': 1,
             'id': 1,
         })
+
+
+class CompressTest(TestBase):
+
+    def testCompressZlib(self):
+        reversion.register(TestModel, compress="zlib")
+        obj_related = TestModelRelated.objects.create()
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+            obj.related.add(obj_related)
+        version = Version.objects.get_for_object(obj).get()
+        self.assertTrue(version.serialized_data.startswith("zlib:"))
+        self.assertEqual(version.field_dict, {
+            "id": obj.pk,
+            "name": "v1",
+            "related": [obj_related.pk],
+        })
+        self.assertEqual(version.raw_field_dict, {
+            "name": "v1",
+            "related": [obj_related.pk],
+        })
+
+    def testCompressRevert(self):
+        reversion.register(TestModel, compress="zlib")
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        with reversion.create_revision():
+            obj.name = "v2"
+            obj.save()
+        Version.objects.get_for_object(obj)[1].revert()
+        obj.refresh_from_db()
+        self.assertEqual(obj.name, "v1")
+
+    def testCompressUncompressedVersion(self):
+        reversion.register(TestModel)
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        reversion.unregister(TestModel)
+        reversion.register(TestModel, compress="zlib")
+        with reversion.create_revision():
+            obj.name = "v2"
+            obj.save()
+        self.assertEqual([version.field_dict["name"] for version in Version.objects.get_for_object(obj)], ["v2", "v1"])
+
+    def testCompressInvalidData(self):
+        reversion.register(TestModel, compress="zlib")
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        Version.objects.get_for_object(obj).update(serialized_data="zlib:boom")
+        with self.assertRaises(reversion.RevertError):
+            Version.objects.get_for_object(obj).get().field_dict
+
+    def testCompressUnavailable(self):
+        with self.assertRaises(reversion.RegistrationError):
+            reversion.register(TestModel, compress="boom")
+
+    @override_settings(REVERSION_BACKEND='dynamodb')
+    def testCompressZlibDynamoDB(self):
+        reversion.register(TestModel, compress="zlib")
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        version = DynamoDBVersion.objects.get_for_object(obj).get()
+        self.assertTrue(version.serialized_data.startswith("zlib:"))
+        self.assertEqual(version.field_dict, {
+            "id": obj.pk,
+            "name": "v1",
+            "related": [],
+        })
+
+
+class DeltaTest(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        reversion.register(TestModel, delta=3)
+
+    def createVersions(self, names):
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        for name in names:
+            with reversion.create_revision():
+                obj.name = name
+                obj.save()
+        return obj
+
+    def testDelta(self):
+        obj = self.createVersions(("v2", "v3", "v4", "v5"))
+        versions = list(Version.objects.get_for_object(obj).order_by("pk"))
+        self.assertEqual(
+            [version.serialized_data.startswith("delta:") for version in versions],
+            [False, True, True, False, True],
+        )
+        self.assertTrue(versions[1].serialized_data.startswith("delta:{}:".format(versions[0].pk)))
+        self.assertTrue(versions[4].serialized_data.startswith("delta:{}:".format(versions[3].pk)))
+        self.assertEqual([version.field_dict["name"] for version in versions], ["v1", "v2", "v3", "v4", "v5"])
+        self.assertEqual(versions[2].raw_field_dict, {"name": "v3", "related": []})
+
+    def testDeltaKeyframesPrefetched(self):
+        obj = self.createVersions(("v2", "v3"))
+        with self.assertNumQueries(2):
+            versions = list(Version.objects.get_for_object(obj).order_by("-pk")[:2])
+            self.assertEqual([version.field_dict["name"] for version in versions], ["v3", "v2"])
+
+    def testDeltaM2M(self):
+        obj = self.createVersions(())
+        obj_related = TestModelRelated.objects.create()
+        with reversion.create_revision():
+            obj.related.add(obj_related)
+        self.assertEqual(Version.objects.get_for_object(obj).first().field_dict, {
+            "id": obj.pk,
+            "name": "v1",
+            "related": [obj_related.pk],
+        })
+
+    def testDeltaCompress(self):
+        reversion.unregister(TestModel)
+        reversion.register(TestModel, delta=3, compress="zlib")
+        obj = self.createVersions(("v2",))
+        version = Version.objects.get_for_object(obj).first()
+        self.assertRegex(version.serialized_data, r"^delta:\d+:zlib:")
+        self.assertEqual(version.field_dict["name"], "v2")
+
+    def testDeltaRevert(self):
+        obj = self.createVersions(("v2", "v3"))
+        Version.objects.get_for_object(obj)[1].revert()
+        obj.refresh_from_db()
+        self.assertEqual(obj.name, "v2")
+
+    def testDeltaGetUnique(self):
+        obj = self.createVersions(("v1", "v2"))
+        self.assertEqual(
+            [version.field_dict["name"] for version in Version.objects.get_for_object(obj).get_unique()],
+            ["v2", "v1"],
+        )
+
+    def testDeltaMissingKeyframe(self):
+        obj = self.createVersions(("v2",))
+        Version.objects.get_for_object(obj).last().revision.delete()
+        with self.assertRaises(reversion.RevertError):
+            Version.objects.get_for_object(obj).get().field_dict
+
+    def testDeltaDeleteRevisionsKeepsKeyframe(self):
+        obj = self.createVersions(("v2", "v3"))
+        self.callCommand("deleterevisions", keep=1)
+        self.assertEqual([version.field_dict["name"] for version in Version.objects.get_for_object(obj)], ["v3", "v1"])
+
+    def testDeltaUnsupportedFormat(self):
+        with self.assertRaises(reversion.RegistrationError):
+            reversion.register(TestModelRelated, format="xml", delta=3)
+
+
+class DeduplicateTest(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        reversion.register(TestModel, deduplicate=True)
+
+    def testDeduplicate(self):
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        with reversion.create_revision():
+            obj.save()
+        with reversion.create_revision():
+            obj.name = "v2"
+            obj.save()
+        versions = list(Version.objects.get_for_object(obj))
+        self.assertEqual([version.serialized_data for version in versions], ["", "", ""])
+        self.assertEqual(len({version.payload_id for version in versions}), 2)
+        self.assertEqual(versions[1].payload_id, versions[2].payload_id)
+        self.assertEqual(VersionPayload.objects.count(), 2)
+        self.assertEqual([version.field_dict["name"] for version in versions], ["v2", "v1", "v1"])
+
+    def testDeduplicatePayloadsPrefetched(self):
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        with reversion.create_revision():
+            obj.name = "v2"
+            obj.save()
+        with self.assertNumQueries(2):
+            self.assertEqual(
+                [version.field_dict["name"] for version in Version.objects.get_for_object(obj)], ["v2", "v1"],
+            )
+
+    def testDeduplicateCompress(self):
+        reversion.unregister(TestModel)
+        reversion.register(TestModel, deduplicate=True, compress="zlib")
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        version = Version.objects.get_for_object(obj).get()
+        self.assertTrue(version.payload.data.startswith("zlib:"))
+        self.assertEqual(version.field_dict["name"], "v1")
+
+    def testDeduplicateRevert(self):
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        with reversion.create_revision():
+            obj.name = "v2"
+            obj.save()
+        Version.objects.get_for_object(obj)[1].revert()
+        obj.refresh_from_db()
+        self.assertEqual(obj.name, "v1")
+
+    def testDeleteRevisionsDeletesUnreferencedPayloads(self):
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        with reversion.create_revision():
+            obj.save()
+        with reversion.create_revision():
+            obj.name = "v2"
+            obj.save()
+        self.callCommand("deleterevisions", keep=2)
+        self.assertEqual(VersionPayload.objects.count(), 2)
+        self.callCommand("deleterevisions", keep=1)
+        self.assertEqual(list(VersionPayload.objects.all()), [Version.objects.get_for_object(obj).get().payload])
+        self.callCommand("deleterevisions")
+        self.assertEqual(VersionPayload.objects.count(), 0)
+
+
+@override_settings(REVERSION_BACKEND='dynamodb', REVERSION_DYNAMODB_TTL=timedelta(days=30))
+class DynamoDBTTLTest(TestBase):
+
+    def assertExpires(self, item, date_created):
+        self.assertAlmostEqual(item.expires, date_created + timedelta(days=30), delta=timedelta(seconds=1))
+
+    def testExpires(self):
+        reversion.register(TestModel)
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        version = DynamoDBVersion.objects.get_for_object(obj).get()
+        self.assertExpires(version, version.date_created)
+        self.assertExpires(version.revision, version.date_created)
+
+    @override_settings(REVERSION_DYNAMODB_TTL=None)
+    def testExpiresWithoutTTL(self):
+        reversion.register(TestModel)
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        version = DynamoDBVersion.objects.get_for_object(obj).get()
+        self.assertIsNone(version.expires)
+        self.assertIsNone(version.revision.expires)
+
+    def testExpiresKeyframe(self):
+        reversion.register(TestModel, delta=10)
+        with reversion.create_revision():
+            reversion.set_date_created(timezone.now() - timedelta(days=10))
+            obj = TestModel.objects.create()
+        with reversion.create_revision():
+            obj.name = "v2"
+            obj.save()
+        version, keyframe = DynamoDBVersion.objects.get_for_object(obj)
+        self.assertEqual(get_delta_keyframe_key(version.serialized_data), keyframe.revision_id)
+        self.assertExpires(keyframe, version.date_created)
+        self.assertExpires(keyframe.revision, version.date_created)
+        self.assertEqual(version.field_dict["name"], "v2")
+
+    def testExpiresKeyframePayload(self):
+        reversion.register(TestModel, delta=10, deduplicate=True)
+        with reversion.create_revision():
+            reversion.set_date_created(timezone.now() - timedelta(days=10))
+            obj = TestModel.objects.create()
+        with reversion.create_revision():
+            obj.name = "v2"
+            obj.save()
+        version, keyframe = DynamoDBVersion.objects.get_for_object(obj)
+        self.assertExpires(keyframe._payload, version.date_created)
+        self.assertEqual(keyframe.field_dict["name"], "v1")
+
+    def testExpiresPayload(self):
+        reversion.register(TestModel, deduplicate=True)
+        with reversion.create_revision():
+            reversion.set_date_created(timezone.now() - timedelta(days=10))
+            obj = TestModel.objects.create()
+        with reversion.create_revision():
+            obj.save()
+        version, old_version = DynamoDBVersion.objects.get_for_object(obj)
+        self.assertEqual(version.payload_key, old_version.payload_key)
+        self.assertExpires(old_version._payload, version.date_created)
+        self.assertExpires(old_version, old_version.date_created)
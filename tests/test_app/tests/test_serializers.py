@@ -0,0 +1,183 @@
+import json
+from unittest.mock import patch
+
+from django.core import serializers
+
+import reversion
+from reversion.backends.sql.models import Version
+from reversion.errors import RevertError
+from reversion.revisions import _get_options
+from test_app.models import (
+    TestModel, TestModelRelated, TestModelParent, TestModelInline, TestModelWithNaturalKey,
+    TestModelInlineByNaturalKey, TestModelEscapePK,
+)
+from test_app.tests.base import TestBase
+
+
+class CompiledSerializerTest(TestBase):
+
+    def assertSerializedAsDjango(self, obj):
+        version_options = _get_options(obj.__class__)
+        self.assertEqual(version_options.serializer(obj), serializers.serialize(
+            version_options.format,
+            (obj,),
+            fields=version_options.fields,
+            use_natural_foreign_keys=version_options.use_natural_foreign_keys,
+        ))
+
+    def testSerialize(self):
+        reversion.register(TestModel)
+        obj = TestModel.objects.create(name="příliš žluťoučký")
+        obj.related.add(TestModelRelated.objects.create(), TestModelRelated.objects.create())
+        self.assertSerializedAsDjango(obj)
+
+    def testSerializePrefetched(self):
+        reversion.register(TestModel)
+        obj = TestModel.objects.create()
+        obj.related.add(TestModelRelated.objects.create())
+        obj = TestModel.objects.prefetch_related("related").get(pk=obj.pk)
+        with self.assertNumQueries(0):
+            self.assertSerializedAsDjango(obj)
+
+    def testSerializeFields(self):
+        reversion.register(TestModel, fields=("name",))
+        self.assertSerializedAsDjango(TestModel.objects.create())
+
+    def testSerializeExclude(self):
+        reversion.register(TestModel, exclude=("name",))
+        self.assertSerializedAsDjango(TestModel.objects.create())
+
+    def testSerializeForeignKey(self):
+        reversion.register(TestModelInline)
+        self.assertSerializedAsDjango(TestModelInline.objects.create(test_model=TestModel.objects.create()))
+
+    def testSerializeInheritance(self):
+        reversion.register(TestModelParent)
+        self.assertSerializedAsDjango(TestModelParent.objects.create())
+
+    def testSerializeCharPrimaryKey(self):
+        reversion.register(TestModelEscapePK)
+        self.assertSerializedAsDjango(TestModelEscapePK.objects.create(name="a/b"))
+
+    def testSerializeNaturalForeignKey(self):
+        reversion.register(TestModelInlineByNaturalKey, use_natural_foreign_keys=True)
+        self.assertSerializedAsDjango(TestModelInlineByNaturalKey.objects.create(
+            test_model=TestModelWithNaturalKey.objects.create(name="v1"),
+        ))
+
+    def testSerializeUnknownFormat(self):
+        reversion.register(TestModel, format="xml")
+        self.assertSerializedAsDjango(TestModel.objects.create())
+
+
+class FieldDictDeserializerTest(TestBase):
+
+    def assertFieldDictAsDjango(self, obj):
+        version = Version.objects.get_for_object(obj).first()
+        field_dict = version._local_field_dict
+        self.assertNotIn("_object_version", version.__dict__)
+        with patch("reversion.backends.utils._get_options", lambda model: _get_options(model)._replace(
+            deserializer=None,
+        )):
+            self.assertEqual(field_dict, Version.objects.get(pk=version.pk)._local_field_dict)
+
+    def testFieldDict(self):
+        reversion.register(TestModel)
+        with reversion.create_revision():
+            obj = TestModel.objects.create(name="v2")
+            obj.related.add(TestModelRelated.objects.create())
+        self.assertFieldDictAsDjango(obj)
+
+    def testFieldDictForeignKey(self):
+        reversion.register(TestModelInline)
+        with reversion.create_revision():
+            obj = TestModelInline.objects.create(test_model=TestModel.objects.create())
+        self.assertFieldDictAsDjango(obj)
+
+    def testFieldDictInheritance(self):
+        reversion.register(TestModelParent)
+        with reversion.create_revision():
+            obj = TestModelParent.objects.create()
+        self.assertFieldDictAsDjango(obj)
+
+    def testFieldDictMissingField(self):
+        reversion.register(TestModel)
+        with reversion.create_revision():
+            obj = TestModel.objects.create(name="v2")
+        Version.objects.get_for_object(obj).update(
+            serialized_data='[{"model": "test_app.testmodel", "pk": %d, "fields": {}}]' % obj.pk,
+        )
+        self.assertEqual(Version.objects.get_for_object(obj).get().field_dict, {"id": obj.pk, "name": "v1"})
+        self.assertFieldDictAsDjango(obj)
+
+    def testFieldDictNaturalKey(self):
+        reversion.register(TestModelInlineByNaturalKey, use_natural_foreign_keys=True)
+        with reversion.create_revision():
+            obj = TestModelInlineByNaturalKey.objects.create(
+                test_model=TestModelWithNaturalKey.objects.create(name="v1"),
+            )
+        version = Version.objects.get_for_object(obj).get()
+        self.assertEqual(version.field_dict, {"id": obj.pk, "test_model_id": obj.test_model_id})
+        # Natural keys are resolved by the Django deserializer.
+        self.assertIn("_object_version", version.__dict__)
+
+
+class FastJsonSerializerTest(TestBase):
+
+    def testSerialize(self):
+        reversion.register(TestModel, format="fastjson")
+        obj = TestModel.objects.create(name="příliš žluťoučký")
+        obj.related.add(TestModelRelated.objects.create())
+        self.assertEqual(
+            json.loads(_get_options(TestModel).serializer(obj)),
+            json.loads(serializers.serialize("json", (obj,), fields=_get_options(TestModel).fields)),
+        )
+
+    def testSerializeWithoutOrjson(self):
+        reversion.register(TestModel, format="fastjson")
+        obj = TestModel.objects.create()
+        data = _get_options(TestModel).serializer(obj)
+        with patch("reversion.serializers.fastjson.orjson", None):
+            self.assertEqual(_get_options(TestModel).serializer(obj), data)
+
+    def testFieldDict(self):
+        reversion.register(TestModel, format="fastjson")
+        with reversion.create_revision():
+            obj = TestModel.objects.create(name="v2")
+            obj.related.add(TestModelRelated.objects.create())
+        version = Version.objects.get_for_object(obj).get()
+        self.assertEqual(version.format, "fastjson")
+        self.assertEqual(version.field_dict, {"id": obj.pk, "name": "v2", "related": [obj.related.get().pk]})
+        self.assertEqual(version._object_version.object.name, "v2")
+
+    def testFieldDictUnicode(self):
+        reversion.register(TestModel, format="fastjson")
+        with reversion.create_revision():
+            obj = TestModel.objects.create(name="příliš žluťoučký")
+        self.assertEqual(Version.objects.get_for_object(obj).get().field_dict["name"], "příliš žluťoučký")
+
+    def testRevert(self):
+        reversion.register(TestModel, format="fastjson")
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        with reversion.create_revision():
+            obj.name = "v2"
+            obj.save()
+        Version.objects.get_for_object(obj)[1].revert()
+        obj.refresh_from_db()
+        self.assertEqual(obj.name, "v1")
+
+    def testReadJsonVersion(self):
+        reversion.register(TestModel)
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        Version.objects.get_for_object(obj).update(format="fastjson")
+        self.assertEqual(Version.objects.get_for_object(obj).get()._object_version.object.name, "v1")
+
+    def testRevertInvalidData(self):
+        reversion.register(TestModel, format="fastjson")
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        Version.objects.get_for_object(obj).update(serialized_data="boom")
+        with self.assertRaises(RevertError):
+            Version.objects.get_for_object(obj).get().revert()
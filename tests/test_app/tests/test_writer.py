@@ -0,0 +1,128 @@
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test.utils import override_settings
+
+import reversion
+from reversion import writer
+from reversion.writer import RevisionWriter
+from test_app.models import TestModel
+from test_app.tests.base import TestBase, TestBaseTransaction, TestModelMixin
+
+
+class RevisionWriterTest(TestBase):
+
+    def tearDown(self):
+        super().tearDown()
+        self.writer.shutdown()
+
+    def testSubmit(self):
+        self.writer = RevisionWriter()
+        results = []
+        self.writer.submit(results.append, 1)
+        self.writer.submit(results.append, 2)
+        self.writer.flush()
+        self.assertEqual(results, [1, 2])
+        self.assertEqual(self.writer.get_metrics(), {
+            "submitted": 2,
+            "committed": 2,
+            "failed": 0,
+            "dropped": 0,
+            "committed_sync": 0,
+            "queued": 0,
+        })
+
+    def testSubmitFailed(self):
+        self.writer = RevisionWriter()
+
+        def fail():
+            raise Exception("Boom!")
+
+        with self.assertLogs("reversion.writer", level="ERROR"):
+            self.writer.submit(fail)
+            self.writer.flush()
+        self.assertEqual(self.writer.get_metrics()["failed"], 1)
+        self.assertEqual(self.writer.get_metrics()["committed"], 0)
+
+    def _submit_to_full_queue(self, results):
+        release = threading.Event()
+        started = threading.Event()
+
+        def block():
+            started.set()
+            release.wait()
+
+        self.writer.submit(block)
+        started.wait()
+        self.writer.submit(results.append, 1)
+        self.writer.submit(results.append, 2)
+        return release
+
+    def testFullPolicySync(self):
+        self.writer = RevisionWriter(queue_size=1, full_policy="sync")
+        results = []
+        release = self._submit_to_full_queue(results)
+        self.assertEqual(results, [2])
+        release.set()
+        self.writer.flush()
+        self.assertEqual(results, [2, 1])
+        self.assertEqual(self.writer.get_metrics()["committed_sync"], 1)
+
+    def testFullPolicySyncFailed(self):
+        self.writer = RevisionWriter(queue_size=1, full_policy="sync")
+        release = threading.Event()
+        started = threading.Event()
+
+        def block():
+            started.set()
+            release.wait()
+
+        def fail():
+            raise Exception("Boom!")
+
+        self.writer.submit(block)
+        started.wait()
+        self.writer.submit(lambda: None)
+        try:
+            with self.assertLogs("reversion.writer", level="ERROR"):
+                self.writer.submit(fail)
+        finally:
+            release.set()
+        self.writer.flush()
+        self.assertEqual(self.writer.get_metrics()["failed"], 1)
+        self.assertEqual(self.writer.get_metrics()["committed_sync"], 0)
+
+    def testFullPolicyDrop(self):
+        self.writer = RevisionWriter(queue_size=1, full_policy="drop")
+        results = []
+        with self.assertLogs("reversion.writer", level="WARNING"):
+            release = self._submit_to_full_queue(results)
+        release.set()
+        self.writer.flush()
+        self.assertEqual(results, [1])
+        self.assertEqual(self.writer.get_metrics()["dropped"], 1)
+
+    def testInvalidFullPolicy(self):
+        self.writer = RevisionWriter()
+        with self.assertRaises(ImproperlyConfigured):
+            RevisionWriter(full_policy="boom")
+
+
+@override_settings(REVERSION_ASYNC_COMMIT=True)
+class CreateRevisionAsyncTest(TestModelMixin, TestBaseTransaction):
+
+    def testCreateRevisionAsync(self):
+        with reversion.create_revision():
+            obj = TestModel.objects.create()
+        writer.flush()
+        self.assertSingleRevision((obj,))
+
+    def testCreateRevisionAsyncException(self):
+        try:
+            with reversion.create_revision():
+                TestModel.objects.create()
+                raise Exception("Boom!")
+        except Exception:
+            pass
+        writer.flush()
+        self.assertNoRevision()